@@ -0,0 +1,136 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Check of the ClickHouse driver against a local stand-in of the HTTP interface.
+The stand-in answers queries in TabSeparatedWithNamesAndTypes with a summary header,
+serves system.query_log and honours KILL QUERY. The check runs a task through the
+driver and verifies the result rows, the server statistics, the query log enrichment,
+the cancellation of a run that exceeds the timeout and the reporting of errors.
+It also reports the client side overhead per run, which should stay well below a
+millisecond on a keep-alive connection.
+
+    python benchmarks/clickhouse.py [runs]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.drivers.clickhouse_driver import ClickhouseDriver  # noqa: E402
+from src.drivers.sqalpel import Sqalpel  # noqa: E402
+
+ROWS = 10
+ELAPSED_NS = 1500000    # the server time in the summary header
+DURATION_MS = 3         # the server time in the query log
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    seen = []
+    killed = set()
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, text, summary=None):
+        data = text.encode('utf-8')
+        self.send_response(status)
+        if summary:
+            self.send_header('X-ClickHouse-Summary', json.dumps(summary))
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        params = parse_qs(urlparse(self.path).query)
+        if 'query' in params:
+            query = params['query'][0]
+        else:
+            query = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        query_id = params.get('query_id', ['?'])[0]
+        out = ''
+        if query.startswith('KILL'):
+            StandIn.killed.add(re.search(r"query_id = '(\w+)'", query).group(1))
+        elif query.startswith('SYSTEM'):
+            pass
+        elif 'query_log' in query:
+            out = ('query_id\tquery_duration_ms\tmemory_usage\tread_rows\tread_bytes\n'
+                   'String\tUInt64\tUInt64\tUInt64\tUInt64\n'
+                   + ''.join(f'{q}\t{DURATION_MS}\t4096\t{ROWS}\t80\n' for q in StandIn.seen if q in query))
+        elif 'sleep' in query:
+            for _ in range(100):
+                if query_id in StandIn.killed:
+                    break
+                time.sleep(0.1)
+            if query_id in StandIn.killed:
+                self.reply(500, 'Code: 394. DB::Exception: Query was cancelled.')
+                return
+        elif 'nosuch' in query:
+            self.reply(404, 'Code: 60. DB::Exception: Table nosuch does not exist.')
+            return
+        else:
+            StandIn.seen.append(query_id)
+            out = 'a\tb\nUInt32\tString\n' + ''.join(f'{i}\tx{i}\n' for i in range(ROWS))
+        self.reply(200, out, {'read_rows': str(ROWS), 'read_bytes': '80', 'written_rows': '0',
+                              'written_bytes': '0', 'elapsed_ns': str(ELAPSED_NS)})
+
+
+def task(query, runs):
+    return {'db': 'default', 'dbms': 'ClickHouse', 'host': 'localhost', 'prelude': '', 'postlude': '',
+            'query': query, 'options': json.dumps({'runlength': runs, 'fingerprint': True}), 'params': {}}
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    Sqalpel.drivers = {'ClickHouse': {'host': '127.0.0.1', 'port': server.server_address[1]}}
+    sqalpel = Sqalpel(argparse.Namespace(server='localhost:5000', ticket='local', timeout=1, debug=False))
+    failed = []
+
+    sqalpel.prepare(task('SELECT a, b FROM t', runs))
+    ClickhouseDriver.run(sqalpel)
+    res = sqalpel.results[0] if sqalpel.results else {'fingerprint': [], 'metrics': {}}
+    if sqalpel.error or len(res['fingerprint']) != runs or any(p['rows'] != ROWS for p in res['fingerprint']):
+        failed.append(f'result rows {res["fingerprint"][:1]} error {sqalpel.error}')
+    server_stats = res['metrics'].get('server', [])
+    if len(server_stats) != runs or any(s.get('elapsed') != ELAPSED_NS / 1000000 for s in server_stats):
+        failed.append(f'summary header elapsed {server_stats[:1]}')
+    if any(s.get('query_duration_ms') != DURATION_MS for s in server_stats):
+        failed.append(f'query log enrichment {server_stats[:1]}')
+    overhead = res['metrics'].get('breakdown', {}).get('overhead', [])
+    if overhead:
+        print(f'{runs} runs, median client overhead {statistics.median(overhead):.3f} ms')
+
+    sqalpel.prepare(task('SELECT sleep(3)', 1))
+    ticks = time.perf_counter()
+    ClickhouseDriver.run(sqalpel)
+    elapsed = time.perf_counter() - ticks
+    res = sqalpel.results[0] if sqalpel.results else {'outcome': None}
+    if res['outcome'] != 'timeout' or elapsed > 2.5:
+        failed.append(f'timeout outcome {res["outcome"]} after {elapsed:.1f} s')
+
+    sqalpel.prepare(task('SELECT * FROM nosuch', 1))
+    ClickhouseDriver.run(sqalpel)
+    if not sqalpel.error or 'nosuch' not in str(sqalpel.error):
+        failed.append(f'error report {sqalpel.error}')
+
+    server.shutdown()
+    for f in failed:
+        print(f'FAILED: {f}')
+    if failed:
+        exit(1)
+    print('ClickHouse stand-in check passed')
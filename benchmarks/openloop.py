@@ -0,0 +1,81 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Check of the open-loop load generator against a scratch SQLite database.
+Below its capacity the server should keep up with the target arrival rate. Beyond it
+the requests queue for a free connection, and the response latency, measured from the
+intended send time, should then run far ahead of the service latency.
+The same run is available from the command line in local mode, e.g.
+    python -m src.drivers.squll --dbms SQLite --options '{"openloop": {"rate": 100, "duration": 10}}'
+
+    python benchmarks/openloop.py [rate]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.drivers.openloop import OpenLoop  # noqa: E402
+from src.drivers.sqalpel import Sqalpel  # noqa: E402
+from src.drivers.sqlite import Sqlite  # noqa: E402
+
+# a few milliseconds of work per request
+SLOW = 'WITH RECURSIVE c(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM c WHERE i < 5000) SELECT count(*) FROM c'
+
+
+def run(query, options):
+    sqalpel = Sqalpel(argparse.Namespace(server='localhost:5000', ticket='local', timeout=None, debug=False))
+    sqalpel.prepare({'db': 'check', 'dbms': 'SQLite', 'host': 'localhost', 'prelude': '', 'postlude': '',
+                     'query': query, 'options': json.dumps({'openloop': options}), 'params': {}})
+    Sqlite.run(sqalpel)
+    res = sqalpel.results[0] if sqalpel.results else {'metrics': {}}
+    return sqalpel.error, res['metrics'].get('openloop')
+
+
+if __name__ == '__main__':
+    rate = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    farm = tempfile.mkdtemp()
+    db = sqlite3.connect(os.path.join(farm, 'check.db'))
+    db.execute('CREATE TABLE t(a INT)')
+    db.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(100)])
+    db.commit()
+    db.close()
+    Sqalpel.drivers = {'SQLite': {'dbfarm': farm + '/'}}
+    failed = []
+
+    options = {'rate': rate, 'duration': 1, 'connections': 2, 'distribution': 'poisson', 'seed': 7}
+    expected = len(list(OpenLoop.schedule(options)))
+    error, stats = run('SELECT count(*) FROM t', options)
+    if error or not stats:
+        failed.append(f'below capacity: error {error}')
+    else:
+        print(f"below capacity: {stats['sent']} sent, {stats['achieved']:.0f}/s achieved, "
+              f"response p99 {stats['response']['percentiles']['99']} ms")
+        if stats['sent'] != expected or stats['failed'] or stats['response']['count'] != expected:
+            failed.append(f"below capacity: {stats['sent']} sent, {stats['failed']} failed, {expected} expected")
+        if not 0.8 * rate < stats['achieved'] < 1.2 * rate:
+            failed.append(f"below capacity: {stats['achieved']:.0f}/s achieved for {rate}/s")
+
+    # far more requests than a single connection can serve in time
+    error, stats = run(SLOW, {'rate': 1000, 'duration': 0.2, 'connections': 1})
+    if error or not stats:
+        failed.append(f'saturated: error {error}')
+    else:
+        response, service = stats['response']['percentiles']['99'], stats['service']['percentiles']['99']
+        print(f"saturated: {stats['achieved']:.0f}/s achieved, response p99 {response} ms, service p99 {service} ms")
+        if stats['achieved'] >= 1000 or response < 10 * service:
+            failed.append(f'saturated: the queueing delay is not counted, response {response} service {service}')
+
+    for f in failed:
+        print(f'FAILED: {f}')
+    if failed:
+        exit(1)
+    print('Open-loop check passed')
@@ -0,0 +1,84 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Check of the plan normalization and of the plan capture.
+Plans that only differ in their literals should share the hash, for the single quoted
+strings of e.g. PostgreSQL as well as the double quoted typed literals of a MonetDB PLAN,
+while plans over other tables or columns should not. The plan capture is checked on a
+scratch SQLite database, where the index used by the query only exists once the prelude
+of the variant has run.
+
+    python benchmarks/plans.py
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.drivers.plans import Plans  # noqa: E402
+from src.drivers.sqalpel import Sqalpel  # noqa: E402
+from src.drivers.sqlite import Sqlite  # noqa: E402
+
+MONETDB = '''project (
+| select (
+| | table("sys"."TABLE") [ "TABLE"."a" NOT NULL UNIQUE, "TABLE"."b" ]
+| ) [ ("TABLE"."a" NOT NULL UNIQUE) = (int(32) "VALUE"), ("TABLE"."b") = (varchar(8) "TEXT") ]
+) [ "TABLE"."a" NOT NULL UNIQUE as "x" ]'''
+
+POSTGRESQL = '''Seq Scan on TABLE  (cost=0.00..35.50 rows=10 width=8)
+  Filter: ((a = VALUE) AND (b = 'TEXT'::text))'''
+
+
+def monetdb(table, value, text):
+    return MONETDB.replace('TABLE', table).replace('VALUE', value).replace('TEXT', text)
+
+
+def postgresql(table, value, text):
+    return POSTGRESQL.replace('TABLE', table).replace('VALUE', value).replace('TEXT', text)
+
+
+def same(a, b):
+    return Plans.normalize(a) == Plans.normalize(b)
+
+
+if __name__ == '__main__':
+    failed = []
+    for name, plan in (('MonetDB', monetdb), ('PostgreSQL', postgresql)):
+        if not same(plan('t', '5', 'abc'), plan('t', '7', 'a b c')):
+            failed.append(f'{name} literals not normalized: {Plans.normalize(plan("t", "5", "abc"))}')
+        if same(plan('t', '5', 'abc'), plan('s', '5', 'abc')):
+            failed.append(f'{name} identifiers normalized: {Plans.normalize(plan("t", "5", "abc"))}')
+
+    farm = tempfile.mkdtemp()
+    Plans.path = os.path.join(farm, 'plans.json')
+    db = sqlite3.connect(os.path.join(farm, 'check.db'))
+    db.execute('CREATE TABLE t(a INT)')
+    db.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(100)])
+    db.commit()
+    db.close()
+    Sqalpel.drivers = {'SQLite': {'dbfarm': farm + '/'}}
+    sqalpel = Sqalpel(argparse.Namespace(server='localhost:5000', ticket='local', timeout=10, debug=False))
+    sqalpel.prepare({'db': 'check', 'dbms': 'SQLite', 'host': 'localhost', 'experiment': 1,
+                     'prelude': 'CREATE INDEX ta ON t(a)', 'postlude': 'DROP INDEX ta',
+                     'query': 'SELECT count(*) FROM t WHERE a = 5',
+                     'options': json.dumps({'runlength': 2, 'plan': True, 'fresh': True}), 'params': {}})
+    Sqlite.run(sqalpel)
+    res = sqalpel.results[0] if sqalpel.results else {}
+    text = res.get('plan', {}).get('text', '')
+    print(f'SQLite plan after the prelude: {text!r}')
+    if sqalpel.error or 'INDEX ta' not in text or len(res.get('times', [])) != 2:
+        failed.append(f'plan capture {text!r} error {sqalpel.error}')
+
+    for f in failed:
+        print(f'FAILED: {f}')
+    if failed:
+        exit(1)
+    print('Plan check passed')
@@ -0,0 +1,65 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Startup-time benchmark for the driver registry.
+It compares a fresh interpreter that looks up a single driver through the
+registry with one that imports every driver module up front, as squll did
+before. The benchmark fails when the lazy path drags in a client library of
+another DBMS. The timings are only telling with all client libraries installed.
+
+    python benchmarks/startup.py [dbms] [repetitions]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLIENTS = ['pymonetdb', 'psycopg2', 'mysql', 'fdb', 'jaydebeapi', 'jpype']
+
+LAZY = """
+import sys
+from src.drivers.registry import Registry
+Registry.lookup('{dbms}')
+print(','.join(m for m in {clients} if m in sys.modules))
+"""
+
+EAGER = """
+import importlib
+from src.drivers.registry import DRIVERS
+for path in set(DRIVERS.values()):
+    try:
+        importlib.import_module(path.split(':')[0])
+    except ImportError:
+        pass
+"""
+
+
+def timed(code, repetitions):
+    times = []
+    out = ''
+    for i in range(repetitions):
+        ticks = time.perf_counter_ns()
+        out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                             stdout=subprocess.PIPE).stdout.decode('utf-8').strip()
+        times.append((time.perf_counter_ns() - ticks) / 1000000)
+    return statistics.median(times), out
+
+
+if __name__ == '__main__':
+    dbms = sys.argv[1] if len(sys.argv) > 1 else 'sqlite'
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    lazy, loaded = timed(LAZY.format(dbms=dbms, clients=CLIENTS), repetitions)
+    eager, _ = timed(EAGER, repetitions)
+    print(f'lazy {dbms} startup {lazy:.1f} ms, eager startup {eager:.1f} ms')
+
+    if loaded:
+        print(f'FAILED: looking up {dbms} imported {loaded}')
+        exit(1)
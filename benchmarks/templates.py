@@ -0,0 +1,62 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Micro-benchmark of the variant generation.
+It compares the former per-parameter re.sub() rewriting of the query, prelude and
+postlude with the compiled templates over a large parameter product.
+
+    python benchmarks/templates.py [values per parameter]
+"""
+
+import itertools
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.drivers.template import Template  # noqa: E402
+
+QUERY = """SELECT l_returnflag, l_linestatus, SUM(l_quantity), AVG(l_extendedprice * (1 - l_discount))
+FROM lineitem
+WHERE l_shipdate <= date '1998-12-01' - interval 'DELTA' day (3)
+  AND l_quantity < QTY AND l_discount BETWEEN DISC - 0.01 AND DISC + 0.01
+  AND l_tax < TAX
+GROUP BY l_returnflag, l_linestatus
+ORDER BY l_returnflag, l_linestatus"""
+BEFORE = "SET optimizer = 'OPT'"
+AFTER = "-- variant DELTA QTY DISC TAX"
+
+
+def resub(names, data):
+    for z in itertools.product(*data):
+        q, b, a = QUERY, BEFORE, AFTER
+        for n, v in zip(names, z):
+            q = re.sub(n, str(v), q)
+            b = re.sub(n, str(v), b)
+            a = re.sub(n, str(v), a)
+
+
+def compiled(names, data):
+    templates = [Template(t, names) for t in (QUERY, BEFORE, AFTER)]
+    for z in itertools.product(*data):
+        values = [str(v) for v in z]
+        for t in templates:
+            t.render(values)
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    names = ['DELTA', 'QTY', 'DISC', 'TAX', 'OPT']
+    data = [list(range(n)) for _ in names]
+    variants = n ** len(names)
+
+    for label, fn in (('re.sub', resub), ('template', compiled)):
+        ticks = time.perf_counter()
+        fn(names, data)
+        elapsed = time.perf_counter() - ticks
+        print(f'{label:10} {variants} variants in {elapsed:.2f} s, {elapsed / variants * 1000000:.2f} us per variant')
@@ -0,0 +1,173 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Check of the interaction with the webserver against a local stand-in.
+The stand-in speaks both wire formats: a get_work request without 'batch' receives a
+single task object and a put_work body holds a single result, while a batched lease
+receives a list of tasks and the results arrive as a gzip compressed {'batch': [...]}.
+The tasks run on a scratch SQLite database. The check covers the sequential and the
+pipelined loop, and a server that disappears after the first task.
+
+    python benchmarks/webserver.py [tasks]
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.drivers.pipeline import Pipeline  # noqa: E402
+from src.drivers.registry import Registry  # noqa: E402
+from src.drivers.sqalpel import Sqalpel  # noqa: E402
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    tasks = []
+    received = []
+    formats = []
+
+    def log_message(self, *args):
+        pass
+
+    def body(self):
+        data = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        return json.loads(data) if data else {}
+
+    def reply(self, obj):
+        data = json.dumps(obj).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        args = self.body()
+        if not StandIn.tasks:
+            self.reply({'error': 'Out of work'})
+            return
+        count = min(int(args.get('batch', 1)), len(StandIn.tasks))
+        lease = [StandIn.tasks.pop(0) for _ in range(count)]
+        StandIn.formats.append('get batch' if 'batch' in args else 'get single')
+        self.reply(lease if 'batch' in args else lease[0])
+
+    def do_POST(self):
+        body = self.body()
+        if 'batch' in body:
+            StandIn.formats.append('put batch' if self.headers.get('Content-Encoding') == 'gzip' else 'put plain batch')
+            StandIn.received.extend(body['batch'])
+        else:
+            StandIn.formats.append('put single')
+            StandIn.received.append(body)
+        self.reply({})
+
+
+def make_tasks(count):
+    return [{'ticket': 'check', 'db': 'check', 'dbms': 'SQLite', 'host': 'localhost',
+             'project': 'check', 'experiment': i, 'tag': 'check',
+             'prelude': '', 'postlude': '', 'query': 'SELECT count(*) FROM t WHERE a < LIM',
+             'options': json.dumps({'runlength': 2}), 'params': {'LIM': json.dumps([i + 1])}}
+            for i in range(count)]
+
+
+def work(server, batch, upload, pipelined):
+    """
+    Run the task loop of squll against the stand-in until it is out of work.
+    :return: the number of tasks executed
+    """
+    sqalpel = Sqalpel(argparse.Namespace(server=server, ticket='check', timeout=10, debug=False,
+                                         batch=batch, upload=upload))
+    sqalpel.leased = []
+    sqalpel.outgoing = []
+    sqalpel.pipeline = None
+    if pipelined:
+        sqalpel.pipeline = Pipeline(sqalpel.lease, sqalpel.post,
+                                    valid=lambda tasks: bool(tasks) and 'error' not in tasks[0])
+    done = 0
+    while True:
+        if sqalpel.get_work():
+            Registry.runner(sqalpel.dbms)(sqalpel)
+            done += 1
+        elif sqalpel.error:
+            break
+        sqalpel.put_work()
+    sqalpel.flush()
+    if sqalpel.pipeline:
+        sqalpel.pipeline.close()
+    return done
+
+
+def check(name, server, tasks, batch, upload, pipelined, expected):
+    StandIn.tasks = make_tasks(tasks)
+    StandIn.received = []
+    StandIn.formats = []
+    done = work(server, batch, upload, pipelined)
+    experiments = sorted(r['experiment'] for r in StandIn.received)
+    formats = sorted(set(StandIn.formats))
+    ok = done == tasks and experiments == list(range(tasks)) and formats == expected \
+        and all(r['runs'] and r['runs'][0]['chksum'] for r in StandIn.received)
+    print(f'{name}: {done} tasks run, {len(experiments)} results received, {formats}')
+    return ok
+
+
+if __name__ == '__main__':
+    tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    farm = tempfile.mkdtemp()
+    db = sqlite3.connect(os.path.join(farm, 'check.db'))
+    db.execute('CREATE TABLE t(a INT)')
+    db.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(100)])
+    db.commit()
+    db.close()
+    Sqalpel.drivers = {'SQLite': {'dbfarm': farm + '/'}}
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    server = f'127.0.0.1:{httpd.server_address[1]}'
+    failed = []
+
+    if not check('single', server, tasks, 1, 1, False, ['get single', 'put single']):
+        failed.append('single wire format')
+    if not check('batched', server, tasks, 3, 3, False, ['get batch', 'put batch', 'put single']):
+        failed.append('batched wire format')
+    if not check('pipelined', server, tasks, 3, 3, True, ['get batch', 'put batch', 'put single']):
+        failed.append('pipelined batched wire format')
+
+    # the server disappears after the first task, the loop should stop without a crash
+    StandIn.tasks = make_tasks(2)
+    sqalpel = Sqalpel(argparse.Namespace(server=server, ticket='check', timeout=10, debug=False))
+    sqalpel.leased = []
+    sqalpel.outgoing = []
+    sqalpel.pipeline = None
+    sqalpel.get_work()
+    Registry.runner(sqalpel.dbms)(sqalpel)
+    sqalpel.put_work()
+    httpd.shutdown()
+    httpd.server_close()
+    # a kept-alive connection would still be served by its handler thread
+    Sqalpel.session.close()
+    Sqalpel.session = None
+    try:
+        if sqalpel.get_work() or sqalpel.put_work() or not sqalpel.error:
+            failed.append(f'lost server not reported: {sqalpel.error}')
+        else:
+            print(f'lost server: {sqalpel.error}')
+    except Exception as msg:
+        failed.append(f'lost server: {msg!r}')
+
+    for f in failed:
+        print(f'FAILED: {f}')
+    if failed:
+        exit(1)
+    print('Webserver stand-in check passed')
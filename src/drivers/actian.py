@@ -0,0 +1,29 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M. Kersten, T Gubner
+
+The Actian (Ingres, Vector) driver over the ingresdbi DB-API module.
+The driver section may name the vnode of a remote installation.
+The terminal monitor based driver is found in actian_client_driver.py.
+
+The tasks reach this driver with the DBMS name 'ingres', the name 'actian' selects the
+terminal monitor. The ingresdbi module comes with the Actian client installation and
+is not part of the Pipfile. Without it the registry reports the driver as unavailable.
+"""
+
+import ingresdbi
+
+from src.drivers.dbapi import DBAPIDriver
+
+
+class Actian(DBAPIDriver):
+    error = ingresdbi.DatabaseError
+
+    @staticmethod
+    def connect(sqalpel):
+        return ingresdbi.connect(database=sqalpel.db, vnode=sqalpel.target.get('vnode', '(local)'))
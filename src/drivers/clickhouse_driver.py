@@ -7,93 +7,185 @@ Copyright 2019- Stichting Sqalpel
 
 Author: M Kersten
 
-Execute a single query multiple times on the database nicknamed 'db'
-and return a list of timings. The first error encountered aborts the sequence.
-The result is a list of dictionaries
-run: [{
-    times: [<response time>]
-    chks: [<integer value to represent result (e.g. cnt,  checksum or hash over result set) >]
-    param: {param1:value1, ....}
-    errors: []
-    }]
-
-If parameter value lists are given, we run the query for each element in the product.
-
-Internal metrics, e.g. cpu load, is returned as a JSON structure in 'metrics' column
+The ClickHouse driver talks to the HTTP interface of the server over a single
+keep-alive connection. A thin cursor on top of it gives the driver the shape of the
+DB-API drivers, which lets it use the same variant generator, timing phases,
+fingerprints and concurrency modes.
+
+The server statistics of each query are taken from the X-ClickHouse-Summary header.
+With wait_end_of_query the header reflects the complete query, and the execute phase
+ends once the server has finished it. After the runs of a variant the entries of
+system.query_log add the memory usage and its query duration, in whole milliseconds,
+as 'query_duration_ms'. The server time 'elapsed' is the precise one of the header,
+the query log duration only stands in when the header lacks it. They are reported
+per run in metrics['server'].
+
+The driver section may contain
+    host: localhost
+    port: 8123
+    user: default
+    password: ''
+    query_log: True
 """
 
-import re
-import subprocess
-import shlex
-import time
-import os
+import json
+import logging
+import uuid
+
+import requests
+
+from src.drivers.dbapi import DBAPIDriver
+
+
+class DatabaseError(Exception):
+    pass
+
+
+class Cursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.arraysize = 1
+        self.description = None
+        self.query_id = None
+        self.summary = {}
+        self.response = None
+        self.lines = iter(())
+
+    def execute(self, query):
+        self.close()
+        self.query_id = uuid.uuid4().hex
+        self.response = self.conn.post(query, self.query_id)
+        self.summary = json.loads(self.response.headers.get('X-ClickHouse-Summary', '{}'))
+        self.response.encoding = 'utf-8'
+        self.lines = self.response.iter_lines(decode_unicode=True)
+        # the result starts with the column names and types
+        names = next(self.lines, None)
+        types = next(self.lines, None)
+        if names is None:
+            self.description = None
+        else:
+            self.description = [(n, t, None, None, None, None, None)
+                                for n, t in zip(names.split('\t'), (types or '').split('\t'))]
+
+    def fetchone(self):
+        line = next(self.lines, None)
+        return None if line is None else tuple(line.split('\t'))
+
+    def fetchmany(self, size=None):
+        rows = []
+        for _ in range(size or self.arraysize):
+            row = self.fetchone()
+            if row is None:
+                break
+            rows.append(row)
+        return rows
+
+    def fetchall(self):
+        return [tuple(line.split('\t')) for line in self.lines]
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+        self.lines = iter(())
+
+
+class Connection:
+
+    def __init__(self, host, port, database, user=None, password=None):
+        self.url = f'http://{host}:{port}/'
+        self.database = database
+        self.settings = {}
+        self.headers = {}
+        if user:
+            self.headers['X-ClickHouse-User'] = user
+        if password:
+            self.headers['X-ClickHouse-Key'] = password
+        # a single keep-alive connection carries all statements
+        self.session = requests.Session()
+        self.session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+    def post(self, query, query_id):
+        params = {'database': self.database,
+                  'query_id': query_id,
+                  'default_format': 'TabSeparatedWithNamesAndTypes',
+                  'wait_end_of_query': 1}
+        params.update(self.settings)
+        try:
+            response = self.session.post(self.url, params=params, data=query.encode('utf-8'),
+                                         headers=self.headers, stream=True)
+        except requests.RequestException as msg:
+            raise DatabaseError(str(msg))
+        if response.status_code != 200:
+            text = response.text.strip()
+            response.close()
+            raise DatabaseError(text or f'HTTP status {response.status_code}')
+        return response
+
+    def cursor(self):
+        return Cursor(self)
+
+    def kill(self, query_id):
+        # the running request occupies the session, the kill goes over a connection of its own
+        requests.post(self.url, params={'query': f"KILL QUERY WHERE query_id = '{query_id}' ASYNC"},
+                      headers=self.headers, timeout=10)
+
+    def close(self):
+        self.session.close()
 
 
-class ClickhouseDriver:
+class ClickhouseDriver(DBAPIDriver):
+    error = DatabaseError
 
-    def __init__(self):
-        pass
+    @staticmethod
+    def connect(sqalpel):
+        section = sqalpel.target
+        return Connection(section.get('host', 'localhost'), section.get('port', 8123), sqalpel.db,
+                          section.get('user'), section.get('password'))
+
+    @staticmethod
+    def limit(sqalpel, conn, seconds):
+        conn.settings['max_execution_time'] = int(seconds)
 
     @staticmethod
-    def run(target):
+    def cancel(sqalpel, conn):
+        if ClickhouseDriver.current and ClickhouseDriver.current.query_id:
+            conn.kill(ClickhouseDriver.current.query_id)
+
+    @classmethod
+    def observe(cls, sqalpel, c):
+        # The server statistics of a query from its summary header
+        stats = {'query_id': c.query_id}
+        for k in ('read_rows', 'read_bytes', 'written_rows', 'written_bytes', 'result_rows'):
+            if k in c.summary:
+                stats[k] = int(c.summary[k])
+        if 'elapsed_ns' in c.summary:
+            stats['elapsed'] = int(c.summary['elapsed_ns']) / 1000000
+        return stats
+
+    @classmethod
+    def wrapup(cls, sqalpel, conn):
         """
-        The number of repetitions is used to derive the best-of value.
-        :param target:
-        :return:
+        Complete the server statistics of the runs of a variant with system.query_log.
+        The log is flushed first, which happens outside the timed runs.
         """
-        db = target['db']
-        query = target['query']
-        runlength = int(target['runlength'])
-        timeout = int(target['timeout'])
-        debug = target.getboolean('debug')
-        response = {'error': '', 'times': [], 'clock': []}
+        runs = sqalpel.metrics.get('server', [])
+        ids = {r['query_id']: r for r in runs if 'memory_usage' not in r}
+        if not ids or not sqalpel.target.get('query_log', True):
+            return
+        c = conn.cursor()
         try:
-            preload = ["%.3f" % v for v in list(os.getloadavg())]
-        except os.error:
-            preload = 0
-            pass
-
-        action = 'clickhouse client --time --format=Null --query="{query}"',
-
-        z = action.format(query=query, database=db)
-        args = shlex.split(z)
-
-        # Retrieve output for post analysis
-        out = subprocess.PIPE
-        err = subprocess.STDOUT
-
-        query = ' '.join(args)
-        if debug:
-            nu = time.strftime('%Y-%m-%d %H:%m:%S', time.localtime())
-            print('Run query:', nu, ':', query)
-
-        for i in range(runlength):
-            try:
-                nu = time.strftime('%Y-%m-%d %H:%m:%S', time.localtime())
-                proc = subprocess.run(args, timeout=timeout, check=True, stdout=out, stderr=err)
-                response['answer'] = 'No answer'
-            except subprocess.SubprocessError as msg:
-                print('EXCEPTION ', i, msg)
-                response['error'] = str(msg).replace("\n", " ").replace("'", "''")
-                return response
-
-            if debug:
-                print('response ', proc.stdout.decode('ascii')[:-1])
-
-            # for the build in drivers we can analyse the result directly for the response time
-            runtime = re.compile('(.*)(\d+\.\d+)(.*)')
-
-            if runtime.match(str(proc.stdout)) is None:
-                # error detected
-                response['error'] = str(proc.stdout)
-                break
-            ms = float(runtime.match(str(proc.stdout)).group(2))
-            response['times'].append(ms)
-            response['clock'].append(nu)
-        try:
-            postload = ["%.3f" % v for v in list(os.getloadavg())]
-        except os.error:
-            postload = 0
-            pass
-        response['cpuload'] = str(preload + postload).replace("'", "")
-        return response
+            c.execute('SYSTEM FLUSH LOGS')
+            c.execute("SELECT query_id, query_duration_ms, memory_usage, read_rows, read_bytes "
+                      "FROM system.query_log WHERE type = 'QueryFinish' AND query_id IN ("
+                      + ', '.join(f"'{q}'" for q in ids) + ")")
+            for query_id, duration, memory, rows, size in c.fetchall():
+                ids[query_id].update({'query_duration_ms': int(duration),
+                                      'memory_usage': int(memory),
+                                      'read_rows': int(rows),
+                                      'read_bytes': int(size)})
+                ids[query_id].setdefault('elapsed', float(duration))
+        except (Exception, DatabaseError) as msg:
+            logging.info(f'No query log available: {msg}')
+        c.close()
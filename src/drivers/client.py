@@ -0,0 +1,210 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+Run experiments through the command line client of a DBMS, e.g. mclient or the Actian
+terminal monitor. A single client process is kept alive and the statements are streamed
+over its stdin. Each request is followed by a sentinel statement that echoes a unique
+token, which marks the end of its output. The output is parsed incrementally, line by
+line, as it arrives. This keeps process start, authentication and connection setup out
+of the measurements.
+
+A driver is a subclass of ClientDriver that describes the client:
+    command     the default command line, overruled by 'command' in the driver section
+    sentinel    the statement that echoes the {token}
+    terminator  appended to a request without one
+    timing      regular expression for the server timings of a statement, named groups in ms
+    errors      regular expression for the error lines
+    rows        regular expression for a row count reported by the client, if any
+    elapsed     the timing groups that add up to the server time of the query
+"""
+
+import logging
+import queue
+import shlex
+import shutil
+import subprocess
+import threading
+import uuid
+
+from src.drivers.connections import ConnectionCache
+
+
+class ClientError(Exception):
+    pass
+
+
+class Client:
+
+    def __init__(self, args, sentinel, terminator=';', timing=None, errors=None, rows=None):
+        self.proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, universal_newlines=True, bufsize=1)
+        self.token = uuid.uuid4().hex
+        self.sentinel = sentinel.format(token=self.token)
+        self.terminator = terminator
+        self.timing = timing
+        self.errors = errors
+        self.rows = rows
+        # the timing line of a sentinel follows its output, it shows up in the next request
+        self.stale = 0
+        self.lines = queue.Queue()
+        self.reader = threading.Thread(target=self.read, daemon=True)
+        self.reader.start()
+
+    def read(self):
+        # stdout and stderr are merged, which keeps the results and timings in order
+        for line in self.proc.stdout:
+            self.lines.put(line.rstrip('\n'))
+        self.lines.put(None)
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def execute(self, text):
+        """
+        Send the statements and consume their output up to the sentinel.
+        The result lines are only counted, they are not kept.
+        :return: (rows, timings, errors) with the number of result rows, as reported by the client
+        or else the number of non-empty output lines, the server timings per statement and the error lines
+        """
+        text = text.strip()
+        if not text.endswith(self.terminator):
+            text += self.terminator
+        try:
+            self.proc.stdin.write(text + '\n' + self.sentinel + '\n')
+            self.proc.stdin.flush()
+        except (OSError, ValueError) as msg:
+            raise ClientError(f'client stopped: {msg}')
+
+        count, reported, timings, errors = 0, None, [], []
+        while True:
+            line = self.lines.get()
+            if line is None:
+                raise ClientError(' '.join(errors) or f'client stopped with exit code {self.proc.poll()}')
+            if self.token in line:
+                break
+            m = self.timing.search(line) if self.timing else None
+            if m:
+                if self.stale:
+                    self.stale -= 1
+                else:
+                    timings.append({k: float(v) for k, v in m.groupdict().items()})
+            elif self.errors and self.errors.search(line):
+                errors.append(line)
+            else:
+                m = self.rows.search(line) if self.rows else None
+                if m:
+                    reported = int(m.group(1))
+                elif line.strip():
+                    count += 1
+        if self.timing:
+            self.stale += 1
+        return count if reported is None else reported, timings, errors
+
+    def close(self):
+        if self.proc.poll() is None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(1)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+                self.proc.wait()
+
+
+class ClientDriver:
+    command = None
+    sentinel = "SELECT '{token}';"
+    terminator = ';'
+    timing = None
+    errors = None
+    rows = None
+    elapsed = ()
+    unbuffered = False      # force line buffered output of a client using stdio
+
+    @classmethod
+    def connect(cls, sqalpel):
+        command = sqalpel.target.get('command', cls.command)
+        args = shlex.split(command.format(database=sqalpel.db))
+        if cls.unbuffered and shutil.which('stdbuf'):
+            args = ['stdbuf', '-oL'] + args
+        return Client(args, cls.sentinel, cls.terminator, cls.timing, cls.errors, cls.rows)
+
+    @staticmethod
+    def ping(client):
+        return client.alive()
+
+    @classmethod
+    def request(cls, client, text):
+        # Run the statements and fail on the errors reported by the client
+        rows, timings, errors = client.execute(text)
+        if errors:
+            raise ClientError(' '.join(errors))
+        return rows, timings
+
+    @classmethod
+    def run(cls, sqalpel):
+        """
+        Run all variants of the task through a single client process.
+        :param sqalpel:
+        :return:
+        """
+        if sqalpel.openloop or sqalpel.concurrency:
+            sqalpel.error = 'The open loop and concurrency modes need a DB-API driver'
+            logging.error(sqalpel.error)
+            return
+
+        # Start the client, or reuse the one of a previous task
+        try:
+            client = ConnectionCache.open(cls, sqalpel)
+        except (Exception, OSError) as msg:
+            sqalpel.error = msg
+            logging.error(f"EXCEPTION {msg}")
+            return
+        sqalpel.guard(cls, client)
+
+        # Collects all variants of an experiment
+        for before, query, after in sqalpel.generate():
+
+            # Process all experiments multiple times
+            try:
+                for i in sqalpel.repetitions(client):
+                    # the cache flush hook may have restarted the server and the client
+                    client = sqalpel.conn
+                    sqalpel.start()
+                    if before:
+                        cls.request(client, before)
+                    sqalpel.phase('before')
+
+                    rows, timings = cls.request(client, query)
+                    sqalpel.phase('execute')
+                    sqalpel.keep(rows)
+                    if timings:
+                        # the server timings of all statements in the query
+                        stats = {k: sum(t.get(k, 0) for t in timings) for k in timings[0]}
+                        if cls.elapsed:
+                            stats['elapsed'] = sum(stats.get(k, 0) for k in cls.elapsed)
+                        sqalpel.measure('server', stats)
+                    sqalpel.phase('fetch')
+
+                    if after:
+                        cls.request(client, after)
+                    sqalpel.phase('after')
+                    sqalpel.done()
+
+            except (Exception, ClientError) as msg:
+                if sqalpel.expired():
+                    # the run was cancelled, continue with the next variant
+                    client = sqalpel.recover(cls, client)
+                    continue
+                logging.error(f'EXCEPTION  {msg}')
+                sqalpel.error = str(msg).replace("\n", " ").replace("'", "''")
+            finally:
+                sqalpel.abort()
+
+        # Keep the client process for the next task
+        ConnectionCache.close(cls, sqalpel, client)
@@ -0,0 +1,139 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+A per-process cache of warm database connections.
+For short experiments establishing a connection can take longer than the query,
+so the drivers keep their connection open across tasks and variants. The cache
+is keyed by the driver, the database and the connection settings of the driver
+section. A cached connection is health checked before it is handed out and
+closed after it has been idle for too long. The transaction of a task is rolled back
+before its connection is cached, the next task should not see its snapshot or state.
+
+The task option 'fresh' requests a new connection for experiments that need one.
+The connection establishment time is reported in the 'connect' metrics.
+"""
+
+import atexit
+import json
+import logging
+import threading
+import time
+
+
+class ConnectionCache:
+    idle = 300      # seconds an unused connection is kept
+    pool = {}
+    lock = threading.Lock()
+    last = {}       # how the most recent connection was obtained
+
+    @staticmethod
+    def key(*args):
+        return json.dumps(args, sort_keys=True, default=str)
+
+    @staticmethod
+    def healthy(conn, ping):
+        try:
+            if callable(ping):
+                return bool(ping(conn))
+            c = conn.cursor()
+            c.execute(ping)
+            c.fetchall()
+            c.close()
+            return True
+        except Exception as msg:
+            logging.info(f'Drop cached connection: {msg}')
+            return False
+
+    @staticmethod
+    def discard(conn):
+        try:
+            conn.close()
+        except Exception as msg:
+            logging.error(f"EXCEPTION {msg}")
+
+    @staticmethod
+    def evict():
+        # Close the connections that have not been used for a while
+        now = time.monotonic()
+        with ConnectionCache.lock:
+            stale = [k for k, (c, used) in ConnectionCache.pool.items() if now - used > ConnectionCache.idle]
+            stale = [ConnectionCache.pool.pop(k)[0] for k in stale]
+        for conn in stale:
+            ConnectionCache.discard(conn)
+
+    @staticmethod
+    def acquire(key, connect, fresh=False, ping='SELECT 1'):
+        """
+        Hand out a healthy cached connection, or establish a new one using connect().
+        Exceptions of connect() are passed on to the driver.
+        """
+        ConnectionCache.evict()
+        with ConnectionCache.lock:
+            entry = ConnectionCache.pool.pop(key, None)
+        if entry:
+            if not fresh and ConnectionCache.healthy(entry[0], ping):
+                ConnectionCache.last = {'ms': 0, 'reused': True}
+                return entry[0]
+            ConnectionCache.discard(entry[0])
+
+        ticks = time.perf_counter_ns()
+        conn = connect()
+        ConnectionCache.last = {'ms': (time.perf_counter_ns() - ticks) / 1000000, 'reused': False}
+        return conn
+
+    @staticmethod
+    def reset(conn):
+        # End the open transaction of a connection, a failure makes it unfit for reuse
+        try:
+            if hasattr(conn, 'rollback'):
+                conn.rollback()
+            return True
+        except Exception as msg:
+            logging.info(f'Drop cached connection: {msg}')
+            return False
+
+    @staticmethod
+    def release(key, conn, fresh=False, reset=None):
+        # a connection that is closed anyway is reset too, the reset may undo server settings
+        healthy = (reset or ConnectionCache.reset)(conn)
+        if fresh or not healthy:
+            ConnectionCache.discard(conn)
+            return
+        with ConnectionCache.lock:
+            old = ConnectionCache.pool.get(key)
+            ConnectionCache.pool[key] = (conn, time.monotonic())
+        if old and old[0] is not conn:
+            ConnectionCache.discard(old[0])
+
+    @staticmethod
+    def open(driver, sqalpel):
+        # The connection of a DB-API driver for the current task
+        if 'idle' in sqalpel.target:
+            ConnectionCache.idle = int(sqalpel.target['idle'])
+        key = ConnectionCache.key(driver.__name__, sqalpel.db, sqalpel.target)
+        conn = ConnectionCache.acquire(key, lambda: driver.connect(sqalpel), sqalpel.fresh,
+                                       getattr(driver, 'ping', 'SELECT 1'))
+        sqalpel.connection = ConnectionCache.last
+        return conn
+
+    @staticmethod
+    def close(driver, sqalpel, conn):
+        key = ConnectionCache.key(driver.__name__, sqalpel.db, sqalpel.target)
+        ConnectionCache.release(key, conn, sqalpel.fresh, getattr(driver, 'reset', None))
+
+    @staticmethod
+    def close_all():
+        with ConnectionCache.lock:
+            conns = [c for c, used in ConnectionCache.pool.values()]
+            ConnectionCache.pool = {}
+        for conn in conns:
+            ConnectionCache.discard(conn)
+
+
+atexit.register(ConnectionCache.close_all)
@@ -0,0 +1,207 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+The common part of the drivers that run a Sqalpel experiment over a DB-API connection.
+The base class owns the connection and cursor lifecycle, the prelude and postlude,
+the timing of the phases and the fetch policy. An engine only supplies
+    error       the exception class of its client library
+    connect()   a new connection for the task
+and optionally
+    ping        the health check of a cached connection
+    limit()     a server side statement timeout
+    cancel()    the native cancellation of the running statement, e.g. of cls.current
+    cursor()    a cursor other than conn.cursor()
+    observe()   server statistics of the run taken from the cursor, kept in metrics['server']
+    probe()     a callable that obtains the server statistics of a run from the engine itself,
+                it is called once the run is over, outside the timed window. Like explain()
+                it is prepared after the prelude of the variant.
+    wrapup()    completes the statistics once the runs of a variant are done
+    explain()   the query plan, captured before the runs with the task option "plan": true,
+                after the prelude of the variant has set up the session
+
+The engine's own execution time of the query is reported as 'elapsed' (ms) in the server
+statistics. The task option "server": true enables the probes that need extra queries.
+
+The cursor is reused for all runs of a variant. The garbage collector is paused while
+the runs of a variant are timed and catches up in between, unless the task option
+"gc": true keeps it running.
+"""
+
+import gc
+import logging
+from abc import abstractmethod
+
+from src.drivers.connections import ConnectionCache
+from src.drivers.openloop import OpenLoop
+from src.drivers.throughput import Throughput
+
+
+class DBAPIDriver:
+    error = Exception
+    current = None      # the cursor of the running variant
+
+    @staticmethod
+    @abstractmethod
+    def connect(sqalpel):
+        pass
+
+    @classmethod
+    def cursor(cls, sqalpel, conn):
+        return conn.cursor()
+
+    @classmethod
+    def observe(cls, sqalpel, cursor):
+        return None
+
+    @classmethod
+    def probe(cls, sqalpel, conn, query):
+        return None
+
+    @classmethod
+    def wrapup(cls, sqalpel, conn):
+        pass
+
+    @classmethod
+    def explain(cls, sqalpel, conn, query):
+        return None
+
+    @classmethod
+    def session(cls, sqalpel, conn, before, after, action):
+        """
+        Call action outside the timed window in the session state of the runs,
+        i.e. between the prelude and the postlude of the variant.
+        """
+        c = cls.cursor(sqalpel, conn)
+        try:
+            if before:
+                c.execute(before)
+            result = action()
+            if after:
+                c.execute(after)
+            return result
+        except (Exception, cls.error):
+            # leave no failed transaction behind for the runs
+            if hasattr(conn, 'rollback'):
+                try:
+                    conn.rollback()
+                except (Exception, cls.error):
+                    pass
+            raise
+        finally:
+            c.close()
+
+    @classmethod
+    def variant(cls, sqalpel, conn, before, query, after):
+        # All runs of a single variant on a single cursor
+        if sqalpel.options.get('plan'):
+            try:
+                sqalpel.plan = cls.session(sqalpel, conn, before, after, lambda: cls.explain(sqalpel, conn, query))
+            except (Exception, cls.error) as msg:
+                logging.info(f'No query plan available: {msg}')
+
+        def server(conn):
+            # the probe may depend on the session state of the runs, e.g. for the query id
+            try:
+                return cls.session(sqalpel, conn, before, after, lambda: cls.probe(sqalpel, conn, query))
+            except (Exception, cls.error) as msg:
+                logging.info(f'No server time available: {msg}')
+                return None
+        probe = server(conn) if sqalpel.options.get('server') else None
+        c = cls.cursor(sqalpel, conn)
+        cls.current = c
+        try:
+            for i in sqalpel.repetitions(conn):
+                if sqalpel.conn is not conn:
+                    # the cache flush hook restarted the server
+                    conn = sqalpel.conn
+                    c = cls.cursor(sqalpel, conn)
+                    cls.current = c
+                    probe = server(conn) if probe else None
+                sqalpel.start()
+                if before:
+                    c.execute(before)
+                sqalpel.phase('before')
+
+                c.execute(query)
+                sqalpel.phase('execute')
+                try:
+                    sqalpel.fetch(c)
+                except (Exception, cls.error) as e:
+                    if sqalpel.expired():
+                        raise
+                    sqalpel.error = e
+                stats = cls.observe(sqalpel, c)
+
+                if after:
+                    c.execute(after)
+                sqalpel.phase('after')
+                sqalpel.done()
+                if probe:
+                    try:
+                        stats = dict(stats or {}, **probe())
+                    except (Exception, cls.error) as msg:
+                        logging.info(f'No server time available: {msg}')
+                if stats is not None:
+                    sqalpel.measure('server', stats)
+        finally:
+            cls.current = None
+            try:
+                c.close()
+            except (Exception, cls.error):
+                pass
+        cls.wrapup(sqalpel, conn)
+
+    @classmethod
+    def run(cls, sqalpel):
+        """
+        Run all variants of the task.
+        :param sqalpel:
+        :return:
+        """
+        if sqalpel.openloop:
+            OpenLoop.run(cls, sqalpel)
+            return
+        if sqalpel.concurrency:
+            Throughput.run(cls, sqalpel)
+            return
+
+        # Establish a clean connection, or reuse a warm one
+        try:
+            conn = ConnectionCache.open(cls, sqalpel)
+        except (Exception, cls.error) as msg:
+            sqalpel.error = str(msg).replace("\n", " ").replace("'", "''")
+            logging.error(f"EXCEPTION {msg}")
+            return
+        sqalpel.guard(cls, conn)
+        # the connection in use, it is replaced after a server restart or a cancelled run
+        sqalpel.conn = conn
+
+        pause = gc.isenabled() and not sqalpel.options.get('gc', False)
+        try:
+            # Collects all variants of an experiment
+            for before, query, after in sqalpel.generate():
+                if pause:
+                    gc.disable()
+                try:
+                    cls.variant(sqalpel, sqalpel.conn, before, query, after)
+                except (Exception, cls.error) as msg:
+                    if sqalpel.expired():
+                        # the run was cancelled, continue with the next variant
+                        sqalpel.conn = sqalpel.recover(cls, sqalpel.conn)
+                        continue
+                    logging.error(f'EXCEPTION  {msg}')
+                    sqalpel.error = str(msg).replace("\n", " ").replace("'", "''")
+                finally:
+                    sqalpel.abort()
+                    if pause:
+                        gc.enable()
+                        gc.collect()
+        finally:
+            # Keep the connection warm for the next task
+            ConnectionCache.close(cls, sqalpel, sqalpel.conn)
@@ -8,64 +8,65 @@ Copyright 2019- Stichting Sqalpel
 Author: M. Kersten
 
 The prototypical driver to run a Sqalpel experiment and report on it.
-
+The server time of a run is found in the performance_schema statement history of the connection.
 """
 
-import mysql
 import logging
 
+import mysql.connector
 
-class MariaDB:
-
-    @staticmethod
-    def run(sqalpel):
-        """
-        :param sqalpel:
-        :return:
-        """
-
-        # Establish a clean connection
-        try:
-            conn = mysql.connector.connect(port=sqalpel.target['port'], database=sqalpel.db, user='root')
-        except (Exception, mysql.connector.DatabaseError()) as msg:
-            sqalpel.error = msg
-            logging.error(f"EXCEPTION {msg}")
-            return
+from src.drivers.dbapi import DBAPIDriver
 
-        # Collects all variants of an experiment
-        for before, query, after in sqalpel.generate():
-            # Process all experiments multiple times
-            try:
-                for i in range(sqalpel.runlength):
-                    c = conn.cursor()
-                    if before:
-                        c.execute(before)
 
-                    sqalpel.start()
-                    c.execute(query)
-                    sqalpel.done()
-                    try:
-                        # if we have a result set, then obtain first row to represent it
-                        r = c.fetchone()
-                        if r:
-                            sqalpel.keep(r)
-                        else:
-                            sqalpel.keep('')
-                    except (Exception, mysql.connector.DatabaseError) as e:
-                        sqalpel.error = e
+class MariaDB(DBAPIDriver):
+    error = mysql.connector.DatabaseError
 
-                    if after:
-                        c.execute(after)
+    @staticmethod
+    def connect(sqalpel):
+        return mysql.connector.connect(port=sqalpel.target['port'], database=sqalpel.db, user='root')
 
-                    c.close()
+    @staticmethod
+    def limit(sqalpel, conn, seconds):
+        c = conn.cursor()
+        c.execute(f'SET SESSION max_statement_time = {float(seconds)}')
+        c.close()
 
-            except (Exception, mysql.connector.DatabaseError) as msg:
-                logging.error(f'EXCEPTION  {msg}')
-                sqalpel.error = str(msg).replace("\n", " ").replace("'", "''")
+    @staticmethod
+    def cancel(sqalpel, conn):
+        # the running statement is killed from a second connection
+        killer = MariaDB.connect(sqalpel)
+        c = killer.cursor()
+        c.execute(f'KILL QUERY {conn.connection_id}')
+        c.close()
+        killer.close()
 
-        # Establish a clean wrapup
+    @classmethod
+    def probe(cls, sqalpel, conn, query):
+        c = conn.cursor()
         try:
-            conn.close()
-        except (Exception,  mysql.connector.DatabaseError) as msg:
-            sqalpel.error = msg
-            logging.error(f"EXCEPTION {msg}")
+            c.execute('SELECT THREAD_ID FROM performance_schema.threads WHERE PROCESSLIST_ID = CONNECTION_ID()')
+            row = c.fetchone()
+        except (Exception, mysql.connector.DatabaseError) as msg:
+            logging.info(f'No server time available: {msg}')
+            return None
+        finally:
+            c.close()
+        if not row:
+            return None
+        thread = row[0]
+        text = query.strip()
+
+        def statistics():
+            c = conn.cursor()
+            c.execute('SELECT SQL_TEXT, TIMER_WAIT, LOCK_TIME, ROWS_SENT, ROWS_EXAMINED '
+                      'FROM performance_schema.events_statements_history '
+                      'WHERE THREAD_ID = %s ORDER BY EVENT_ID DESC', (thread,))
+            rows = c.fetchall()
+            c.close()
+            for sql, wait, lock, sent, examined in rows:
+                # the timers count picoseconds
+                if sql and sql.strip() == text:
+                    return {'elapsed': wait / 1000000000, 'lock': lock / 1000000000,
+                            'rows_sent': sent, 'rows_examined': examined}
+            return {}
+        return statistics
@@ -8,64 +8,104 @@ Copyright 2019- Stichting Sqalpel
 Author: M Kersten
 
 The prototypical MonetDB driver to run a Sqalpel experiment and report on it.
+The server time of a run is taken from the most recent sys.querylog entry of the query.
+When the query log is off, it is switched on for the first variant that needs it and off
+again once the task releases its connection. A query log that was already on is left alone.
+The query plan is the relational plan produced by PLAN.
 """
 
 import logging
+import socket
+import uuid
+
 import pymonetdb
 
+from src.drivers.dbapi import DBAPIDriver
+
 
-class MonetDB:
+class MonetDB(DBAPIDriver):
+    error = pymonetdb.DatabaseError
+    querylog = False    # the query log was switched on by squll for the server times
+
+    @staticmethod
+    def connect(sqalpel):
+        return pymonetdb.connect(database=sqalpel.db)
 
     @staticmethod
-    def run(sqalpel):
-        """
-        :param sqalpel:
-        :return:
-        """
+    def limit(sqalpel, conn, seconds):
+        c = conn.cursor()
+        c.execute(f'CALL sys.setquerytimeout({int(seconds)})')
+        c.close()
+        conn.commit()
 
-        # Establish a clean connection
+    @staticmethod
+    def cancel(sqalpel, conn):
+        # pymonetdb can not cancel a query, shutting down the socket unblocks the client
+        conn.mapi.socket.shutdown(socket.SHUT_RDWR)
+
+    @classmethod
+    def explain(cls, sqalpel, conn, query):
+        # the relational plan, the MAL plan of EXPLAIN also reflects the optimizer pipeline
+        c = conn.cursor()
         try:
-            conn = pymonetdb.connect(database=sqalpel.db)
+            c.execute('PLAN ' + query)
+            return '\n'.join(row[0] for row in c.fetchall())
+        finally:
+            c.close()
+
+    @classmethod
+    def reset(cls, conn):
+        # End the transaction of the task and switch the query log off when squll switched it on
+        try:
+            conn.rollback()
+            if cls.querylog:
+                c = conn.cursor()
+                c.execute('CALL sys.querylog_disable()')
+                c.close()
+                conn.commit()
+                cls.querylog = False
+            return True
         except (Exception, pymonetdb.DatabaseError) as msg:
-            sqalpel.error = msg
-            logging.error(f"EXCEPTION {msg}")
-            return
+            logging.info(f'Drop cached connection: {msg}')
+            return False
 
-        # Collects all variants of an experiment
-        for before, query, after in sqalpel.generate():
+    @staticmethod
+    def logged(conn):
+        # Whether the query log is on, a marked query then shows up in the catalog.
+        # The lookup assembles the mark, its own text should not match.
+        mark = uuid.uuid4().hex
+        c = conn.cursor()
+        try:
+            c.execute(f"SELECT 'squll {mark}'")
+            c.execute(f"SELECT count(*) FROM sys.querylog_catalog WHERE query LIKE ('%squll ' || '{mark}%')")
+            return c.fetchone()[0] > 0
+        finally:
+            c.close()
 
-            # Process all experiments multiple times
+    @classmethod
+    def probe(cls, sqalpel, conn, query):
+        if not cls.querylog:
             try:
-                for i in range(sqalpel.runlength):
+                if not cls.logged(conn):
                     c = conn.cursor()
-                    if before:
-                        c.execute(before)
-
-                    sqalpel.start()
-                    c.execute(query)
-                    sqalpel.done()
-                    try:
-                        # if we have a result set, then obtain first row to represent it
-                        r = c.fetchone()
-                        if r:
-                            sqalpel.keep(r)
-                        else:
-                            sqalpel.keep('')
-                    except (Exception, pymonetdb.DatabaseError) as e:
-                        sqalpel.error = e
-
-                    if after:
-                        c.execute(after)
-
+                    c.execute('CALL sys.querylog_enable()')
                     c.close()
+                    conn.commit()
+                    cls.querylog = True
             except (Exception, pymonetdb.DatabaseError) as msg:
-                logging.error(f'EXCEPTION  {msg}')
-                sqalpel.error = str(msg).replace("\n", " ").replace("'", "''")
+                logging.info(f'No server time available: {msg}')
+                return None
+        text = query.strip().rstrip(';').strip()
 
-        # Establish a clean wrapup
-        try:
-            conn.close()
-        except (Exception, pymonetdb.DatabaseError) as msg:
-            sqalpel.error = msg
-            logging.error(f"EXCEPTION {msg}")
-            return
+        def statistics():
+            c = conn.cursor()
+            c.execute('SELECT q.query, c.run, c.ship, c.tuples FROM sys.querylog_calls c, sys.querylog_catalog q '
+                      'WHERE c.id = q.id ORDER BY c."start" DESC LIMIT 10')
+            rows = c.fetchall()
+            c.close()
+            for q, run, ship, tuples in rows:
+                # the run and ship times are kept in microseconds
+                if q and q.strip().rstrip(';').strip() == text:
+                    return {'elapsed': run / 1000, 'ship': ship / 1000, 'tuples': tuples}
+            return {}
+        return statistics
@@ -7,92 +7,24 @@ Copyright 2019- Stichting Sqalpel
 
 Author: M Kersten
 
-Execute a single query multiple times on the database nicknamed 'dbms'
-and return a list of timings. The first error encountered stops the sequence.
-The result is a dictionary with at least the structure {'times': [...]}
-
 Use the command line tool mclient to gather more details.
+A single mclient process runs all variants of a task. The server timings of each
+statement, as reported by -tperformance, are kept per run in metrics['server'].
+The number of result rows serves as the checksum.
 """
 
 import re
-import subprocess
-import shlex
-import time
-import os
-
-
-class MonetDBClientDriver:
-
-    def __init__(self):
-        pass
-
-    @staticmethod
-    def run(task):
-        """
-        The number of repetitions is used to derive the best-of value.
-        :param task:
-        :return:
-        """
-        db = task['db']
-        query = task['query']
-        runlength = int(task['runlength'])
-        timeout = int(task['timeout'])
-        debug = task['debug']
-        response = {'error': '', 'times': [], 'cnt': [], 'clock': [], 'extra': []}
-        try:
-            preload = ["%.3f" % v for v in list(os.getloadavg())]
-        except os.error:
-            preload = 0
-            pass
-        action = 'mclient -d {database} -tperformance -ftrash -s "{query}"'
-
-        z = action.format(query=query, database=db)
-        args = shlex.split(z)
-
-        # Retrieve output for post analysis
-        out = subprocess.PIPE
-        err = subprocess.STDOUT
-
-        query = ' '.join(args)
-        if debug:
-            nu = time.strftime('%Y-%m-%d %H:%m:%S', time.localtime())
-            print('Run query:', nu, ':',  query)
 
-        for i in range(runlength):
-            try:
-                nu = time.strftime('%Y-%m-%d %H:%m:%S', time.localtime())
-                proc = subprocess.run(args, timeout=timeout, check=True, stdout=out, stderr=err)
-                response['answer'] = 'No answer'
-            except subprocess.SubprocessError as msg:
-                # a timeout should also stop the database process involved the hard way
-                print('EXCEPTION ', i,  msg)
-                response['error'] = str(msg).replace("\n", " ").replace("'", "''")
-                return response
+from src.drivers.client import ClientDriver
 
-            if debug:
-                print('response ', proc.stdout.decode('ascii')[:-1])
 
-            # for the build in drivers we can analyse the result directly for the response time
-            runtime = re.compile('(.*run:)(\d+\.\d+)(.*)')
-            optimizer = re.compile('(.*opt:)(\d+\.\d+)(.*)')
-            sqlparse = re.compile('(.*sql:)(\d+\.\d+)(.*)')
-            if runtime.match(str(proc.stdout)) is None:
-                # error detected
-                response['error'] = str(proc.stdout).replace("'", "''")
-                response['error'] = response['error'][response['error'].find('ERROR ') + 8:]
-                break
-            ms = float(runtime.match(str(proc.stdout)).group(2))
-            opt = float(optimizer.match(str(proc.stdout)).group(2))
-            sql = float(sqlparse.match(str(proc.stdout)).group(2))
+class MonetDBClientDriver(ClientDriver):
+    command = 'mclient -d {database} -tperformance -fcsv'
+    timing = re.compile(r'sql:(?P<sql>\d+\.\d+)\s+opt:(?P<opt>\d+\.\d+)\s+run:(?P<run>\d+\.\d+)\s+clk:(?P<clk>\d+\.\d+)')
+    errors = re.compile(r'^(MAPI|QUERY|ERROR|CODE) *= ')
+    # parsing, optimizing and running the query, clk is the wall clock time of mclient
+    elapsed = ('sql', 'opt', 'run')
 
-            response['times'].append(ms + opt + sql)
-            response['cnt'].append(-1)  # not yet collected
-            response['extra'].append([ms, opt, sql])
-            response['clock'].append(nu)
-        try:
-            postload = ["%.3f" % v for v in list(os.getloadavg())]
-        except os.error:
-            postload = 0
-            pass
-        response['cpuload'] = str(preload + postload).replace("'", "")
-        return response
+    @classmethod
+    def limit(cls, sqalpel, client, seconds):
+        cls.request(client, f'CALL sys.setquerytimeout({int(seconds)});')
@@ -0,0 +1,177 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+Open-loop load generation for a Sqalpel experiment.
+Instead of repeating a query as soon as the previous one returns, the variants
+are issued at a fixed target arrival rate. A pool of client threads, each with
+its own driver connection, picks up the requests. The latency is measured from
+the intended send time of a request, which includes the time it waited for a
+free connection (coordinated-omission correction).
+
+The task option 'openloop' controls the experiment:
+    "openloop": {"rate": 200,                 requests per second
+                 "distribution": "poisson",   or "constant"
+                 "duration": 10,              seconds per variant
+                 "connections": 4,            size of the connection pool
+                 "seed": 1}                   for reproducible Poisson arrivals
+
+The response (from intended send time) and service (execution only) latencies are
+kept in HDR-style histograms and reported in the 'openloop' section of the metrics.
+"""
+
+import logging
+import random
+import threading
+import time
+
+from src.drivers.throughput import Throughput
+
+
+class Histogram:
+    """
+    A sparse log-linear histogram in the spirit of HdrHistogram.
+    Values are recorded in microseconds. Each power of two is split into
+    2^precision linear sub-buckets, which bounds the relative error of a
+    reported value to 2^-precision.
+    """
+
+    def __init__(self, precision=7):
+        self.precision = precision
+        self.counts = {}
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def record(self, ms):
+        v = max(0, int(ms * 1000))
+        shift = max(0, v.bit_length() - self.precision - 1)
+        key = (v >> shift) << shift
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.total += 1
+        self.min = v if self.min is None else min(self.min, v)
+        self.max = v if self.max is None else max(self.max, v)
+
+    def percentile(self, p):
+        # Return the value in ms below which p percent of the recordings fall
+        if not self.total:
+            return None
+        rank = max(1, int(p / 100 * self.total + 0.5))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= rank:
+                return min(key, self.max) / 1000
+        return self.max / 1000
+
+    def export(self):
+        return {'count': self.total,
+                'min': self.min / 1000 if self.total else None,
+                'max': self.max / 1000 if self.total else None,
+                'percentiles': {str(p): self.percentile(p) for p in (50, 90, 95, 99, 99.9)},
+                'buckets': [[k / 1000, self.counts[k]] for k in sorted(self.counts)]}
+
+
+class OpenLoop:
+
+    @staticmethod
+    def schedule(options):
+        # Generate the intended send times in ns relative to the start of the variant
+        rate = float(options.get('rate', 10))
+        duration = float(options.get('duration', 10)) * 1000000000
+        poisson = options.get('distribution', 'constant') == 'poisson'
+        rnd = random.Random(options.get('seed', 1))
+        offset = 0.0
+        while offset < duration:
+            yield int(offset)
+            gap = rnd.expovariate(rate) if poisson else 1 / rate
+            offset += gap * 1000000000
+
+    @staticmethod
+    def worker(driver, sqalpel, variant, state, barrier):
+        conn = None
+        try:
+            conn = driver.connect(sqalpel)
+        except Exception as msg:
+            state['error'] = str(msg)
+        # all connections are established before the clock starts
+        barrier.wait()
+        if conn is None:
+            return
+
+        while True:
+            with state['lock']:
+                intended = next(state['schedule'], None)
+                state['sent'] += intended is not None
+            if intended is None:
+                break
+            intended += state['start']
+            delay = intended - time.perf_counter_ns()
+            if delay > 0:
+                time.sleep(delay / 1000000000)
+
+            ticks = time.perf_counter_ns()
+            try:
+                Throughput.execute(conn, *variant)
+            except Exception as msg:
+                with state['lock']:
+                    state['failed'] += 1
+                    state['failure'] = str(msg).replace("\n", " ").replace("'", "''")
+                continue
+            now = time.perf_counter_ns()
+            with state['lock']:
+                state['service'].record((now - ticks) / 1000000)
+                state['response'].record((now - intended) / 1000000)
+                state['times'].append((now - intended) / 1000000)
+        try:
+            conn.close()
+        except Exception as msg:
+            logging.error(f"EXCEPTION {msg}")
+
+    @staticmethod
+    def run(driver, sqalpel):
+        options = sqalpel.openloop
+        pool = int(options.get('connections', 4))
+
+        # Collects all variants of an experiment
+        for variant in sqalpel.generate():
+            state = {'lock': threading.Lock(),
+                     'schedule': OpenLoop.schedule(options),
+                     'sent': 0,
+                     'failed': 0,
+                     'service': Histogram(),
+                     'response': Histogram(),
+                     'times': []}
+            barrier = threading.Barrier(pool, action=lambda: state.update({'start': time.perf_counter_ns()}))
+            workers = [threading.Thread(target=OpenLoop.worker,
+                                        args=(driver, sqalpel, variant, state, barrier),
+                                        daemon=True)
+                       for _ in range(pool)]
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+
+            if 'error' in state:
+                logging.error(f"EXCEPTION {state['error']}")
+                sqalpel.error = state['error']
+                continue
+            wall = (time.perf_counter_ns() - state['start']) / 1000000000
+            sqalpel.times.extend(state['times'])
+            sqalpel.chks.extend(['' for _ in state['times']])
+            sqalpel.metrics['openloop'] = {'rate': float(options.get('rate', 10)),
+                                           'distribution': options.get('distribution', 'constant'),
+                                           'connections': pool,
+                                           'sent': state['sent'],
+                                           'failed': state['failed'],
+                                           'failure': state.get('failure'),
+                                           'achieved': len(state['times']) / wall if wall else 0,
+                                           'response': state['response'].export(),
+                                           'service': state['service'].export()}
+            if sqalpel.debug:
+                logging.info(f"Open loop {sqalpel.metrics['openloop']}")
@@ -0,0 +1,214 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+A durable outbox for the task results.
+Completed results are appended to a local journal before they are sent.
+Each record is a zlib compressed JSON document prefixed by its length, and the
+journal is fsync'ed after every append. A background uploader drains the journal
+in batches and only advances the persistent offset once the server accepted them.
+Failed uploads are retried with an exponential backoff, and a restart resumes
+where the previous process stopped.
+
+A record that can not be decoded is moved to the 'corrupt' file next to the journal
+and the uploader continues with the next one.
+
+Every result carries a 'submission' identifier, which lets the server ignore a
+batch that is sent twice, e.g. when squll stopped between an upload and the
+update of the offset.
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+import uuid
+import zlib
+
+HEADER = struct.Struct('<I')
+
+
+class Outbox:
+
+    def __init__(self, path, upload, batch=10, gate=None):
+        """
+        :param path: directory holding the journal and its offset
+        :param upload: callable that sends a list of payloads, returns True on success
+        :param batch: maximal number of payloads per upload
+        :param gate: optional pipeline to keep the uploads out of the timed windows
+        """
+        os.makedirs(path, exist_ok=True)
+        self.journal = os.path.join(path, 'journal')
+        self.offsetfile = os.path.join(path, 'offset')
+        self.corrupt = os.path.join(path, 'corrupt')
+        self.upload = upload
+        self.batch = batch
+        self.gate = gate
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = False
+        self.backoff = 0
+        self.offset = self.recover()
+
+        self.worker = threading.Thread(target=self.loop, daemon=True)
+        self.worker.start()
+        self.wake.set()
+
+    def recover(self):
+        # Cut off a partially written record and return the offset to resume from
+        offset = 0
+        if os.path.exists(self.offsetfile):
+            with open(self.offsetfile, 'r') as f:
+                offset = int(f.read() or 0)
+        if not os.path.exists(self.journal):
+            return 0
+        size = os.path.getsize(self.journal)
+        end = 0
+        with open(self.journal, 'rb') as f:
+            while True:
+                head = f.read(HEADER.size)
+                if len(head) < HEADER.size:
+                    break
+                length = HEADER.unpack(head)[0]
+                if len(f.read(length)) < length:
+                    break
+                end = f.tell()
+        if end < size:
+            logging.error(f'Truncate incomplete outbox record at {end}')
+            with open(self.journal, 'r+b') as f:
+                f.truncate(end)
+                os.fsync(f.fileno())
+        if offset > end:
+            offset = 0
+        if end > offset:
+            logging.info(f'Outbox resumes with {end - offset} bytes of pending results')
+        return offset
+
+    def append(self, payloads):
+        """
+        Make the task results durable. The call only involves the local disk,
+        which keeps the experiment loop independent of the server.
+        """
+        with self.lock:
+            with open(self.journal, 'ab') as f:
+                for p in payloads:
+                    if isinstance(p, dict):
+                        p.setdefault('submission', uuid.uuid4().hex)
+                    record = zlib.compress(json.dumps(p).encode('utf-8'))
+                    f.write(HEADER.pack(len(record)) + record)
+                f.flush()
+                os.fsync(f.fileno())
+        self.wake.set()
+        return True
+
+    def pending(self):
+        # Read the next batch of records after the committed offset
+        payloads = []
+        with self.lock:
+            if not os.path.exists(self.journal):
+                return payloads, self.offset
+            with open(self.journal, 'rb') as f:
+                f.seek(self.offset)
+                while len(payloads) < self.batch:
+                    head = f.read(HEADER.size)
+                    if len(head) < HEADER.size:
+                        break
+                    length = HEADER.unpack(head)[0]
+                    record = f.read(length)
+                    try:
+                        payloads.append(json.loads(zlib.decompress(record).decode('utf-8')))
+                    except (zlib.error, ValueError) as msg:
+                        self.quarantine(f.tell() - length - HEADER.size, head + record, msg)
+                return payloads, f.tell()
+
+    def quarantine(self, position, record, msg):
+        # Keep an undecodable record aside for inspection, it is never sent
+        logging.error(f'Move corrupt outbox record at {position} to {self.corrupt}: {msg}')
+        with open(self.corrupt, 'ab') as f:
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def commit(self, offset):
+        tmp = self.offsetfile + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.offsetfile)
+        self.offset = offset
+
+    def compact(self):
+        # Once everything is delivered the journal starts afresh
+        with self.lock:
+            if os.path.exists(self.journal) and os.path.getsize(self.journal) == self.offset and self.offset:
+                # reset the offset first, a crash in between only leads to a resubmission
+                self.commit(0)
+                with open(self.journal, 'r+b') as f:
+                    f.truncate(0)
+                    os.fsync(f.fileno())
+
+    def send(self, payloads):
+        try:
+            if self.gate:
+                return self.gate.network_call(self.upload, payloads)
+            return self.upload(payloads)
+        except Exception as msg:
+            logging.error(f'EXCEPTION {msg}')
+            return False
+
+    def drain(self):
+        # Send batches until the journal is empty or the server refuses
+        while True:
+            payloads, offset = self.pending()
+            if not payloads and offset != self.offset:
+                # only corrupt records were read
+                self.commit(offset)
+                continue
+            if not payloads:
+                self.compact()
+                return True
+            if not self.send(payloads):
+                return False
+            self.commit(offset)
+            self.backoff = 0
+
+    def loop(self):
+        while not self.stopped:
+            self.wake.wait(self.backoff or None)
+            self.wake.clear()
+            try:
+                done = self.drain()
+            except Exception as msg:
+                # e.g. a full disk, the journal is tried again later
+                logging.error(f'EXCEPTION {msg}')
+                done = False
+            if not done:
+                self.backoff = min(60, max(1, self.backoff * 2))
+                logging.error(f'Outbox upload failed, retry in {self.backoff} seconds')
+
+    def close(self, timeout=30):
+        """
+        Try to deliver the remaining results. Whatever is left stays in the
+        journal and is picked up by the next squll process.
+        """
+        self.stopped = True
+        self.wake.set()
+        self.worker.join(timeout)
+        if self.worker.is_alive():
+            logging.error(f'Undelivered results remain in {self.journal}')
+            return False
+        try:
+            done = self.drain()
+        except Exception as msg:
+            logging.error(f'EXCEPTION {msg}')
+            done = False
+        if not done:
+            logging.error(f'Undelivered results remain in {self.journal}')
+        return done
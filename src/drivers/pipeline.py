@@ -0,0 +1,163 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+Overlap the interaction with the webserver with the execution of a task.
+A background worker prefetches the next task while the current one runs and
+uploads the results of the previous task. The driver brackets each timed
+window with enter()/leave(); the worker never talks to the server inside such
+a window, so network activity does not disturb the measurements.
+
+The pipeline is agnostic of the protocol. It is constructed with
+    fetch()          obtain the next unit of work, e.g. Sqalpel.lease
+    upload(payload)  deliver a result, returns True on success
+    valid(work)      whether the work is real, rather than an error or 'Out of work'
+Invalid work is not prefetched again, which leaves the backoff policy to the caller.
+
+A failed upload is retried a few times with a growing delay. A payload that still
+can not be delivered is kept and tried again before the next uploads and on close().
+'failed' counts the payloads that are not delivered yet.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+
+class Pipeline:
+
+    def __init__(self, fetch, upload, valid=bool, retries=3, backoff=1.0):
+        self.fetch = fetch
+        self.upload = upload
+        self.valid = valid
+        self.retries = retries
+        self.backoff = backoff
+        self.rejected = []      # payloads whose upload failed, they are tried again later
+        self.tasks = queue.Queue(maxsize=1)
+        self.uploads = queue.Queue()
+        self.want = threading.Event()
+        self.work = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.wire = threading.Lock()
+        self.prefetched = False
+        self.stopped = False
+        self.failed = 0
+
+        # bookkeeping to measure the utilization gained
+        self.begin = time.perf_counter_ns()
+        self.network = 0
+        self.stall = 0
+
+        self.worker = threading.Thread(target=self.loop, daemon=True)
+        self.worker.start()
+
+    def enter(self):
+        # Start of a timed window, wait for an ongoing request to finish
+        with self.wire:
+            self.idle.clear()
+
+    def leave(self):
+        self.idle.set()
+
+    def next(self):
+        """
+        Return the next unit of work. It is normally fetched while the previous task
+        was running; otherwise we stall until the worker has retrieved it.
+        """
+        ticks = time.perf_counter_ns()
+        if not self.prefetched:
+            self.want.set()
+            self.work.set()
+        work = self.tasks.get()
+        self.stall += time.perf_counter_ns() - ticks
+
+        # immediately prefetch the successor of real work
+        self.prefetched = self.valid(work)
+        if self.prefetched:
+            self.want.set()
+            self.work.set()
+        return work
+
+    def submit(self, payload):
+        self.uploads.put(payload)
+        self.work.set()
+
+    def network_call(self, fn, *args):
+        # The worker only contacts the server outside the timed windows
+        while True:
+            self.idle.wait()
+            with self.wire:
+                if not self.idle.is_set():
+                    continue
+                ticks = time.perf_counter_ns()
+                try:
+                    return fn(*args)
+                except Exception as msg:
+                    logging.error(f'EXCEPTION {msg}')
+                    return None
+                finally:
+                    self.network += time.perf_counter_ns() - ticks
+
+    def deliver(self, payload):
+        # Upload a payload, retrying with a growing delay
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            if self.network_call(self.upload, payload):
+                return True
+        return False
+
+    def loop(self):
+        while True:
+            self.work.wait()
+            self.work.clear()
+            # results are shipped first, they free memory and are the most valuable
+            retry, self.rejected = self.rejected, []
+            for payload in retry:
+                if not self.deliver(payload):
+                    self.rejected.append(payload)
+            while not self.uploads.empty():
+                payload = self.uploads.get()
+                if not self.deliver(payload):
+                    self.rejected.append(payload)
+                    logging.error('Error encountered in sending result')
+                self.failed = len(self.rejected)
+                self.uploads.task_done()
+            self.failed = len(self.rejected)
+            if self.want.is_set() and not self.stopped:
+                self.want.clear()
+                self.tasks.put(self.network_call(self.fetch))
+            if self.stopped and self.uploads.empty():
+                return
+
+    def close(self):
+        # Wait for the pending uploads, including a last attempt of the failed ones, and stop the worker
+        ticks = time.perf_counter_ns()
+        self.stopped = True
+        self.work.set()
+        self.uploads.join()
+        self.worker.join()
+        if self.failed:
+            logging.error(f'{self.failed} results could not be sent')
+        self.stall += time.perf_counter_ns() - ticks
+        return self.failed == 0
+
+    def report(self):
+        """
+        The utilization is the fraction of the wall clock time the task loop was not
+        stalled on the network. The hidden time is the network time that overlapped
+        with the task execution and would otherwise have been on the critical path.
+        """
+        wall = time.perf_counter_ns() - self.begin
+        return {'wall': wall / 1000000000,
+                'network': self.network / 1000000000,
+                'stall': self.stall / 1000000000,
+                'hidden': max(0, self.network - self.stall) / 1000000000,
+                'utilization': (wall - self.stall) / wall if wall else 0}
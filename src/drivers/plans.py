@@ -0,0 +1,115 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+The query plans of the variants and the detection of plan changes.
+A plan is normalized before it is hashed: the cost and cardinality estimates are removed
+and all literals are replaced by '?', both the quoted strings and the typed literals
+that MonetDB puts in double quotes. Two variants that only differ in their parameter
+values then share the plan hash when the optimizer picked the same plan for them.
+
+The latest plan hash of each query of an experiment is kept in a local store. A hash that
+differs from the stored one is reported as a plan flip, e.g. after a server upgrade or
+a change in the data distribution.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+
+# the estimates in a JSON plan, e.g. of PostgreSQL EXPLAIN (FORMAT JSON)
+ESTIMATES = re.compile(r'cost|rows|width|filtered', re.IGNORECASE)
+COSTS = re.compile(r'\((cost|rows|width)=[^)]*\)')
+STRINGS = re.compile(r"'(?:[^']|'')*'")
+# the typed literals of a MonetDB PLAN, e.g. int(32) "5" or varchar "abc",
+# other double quoted names are identifiers, e.g. table("sys"."t") or as "x"
+TYPED = re.compile(r'\b(?!as\b)([a-z]\w*(\(\d+(,\s*\d+)?\))?)\s+"(?:[^"\\]|\\.)*"')
+NUMBERS = re.compile(r'(?<![\w.])-?\d+(\.\d+)?([eE][-+]?\d+)?(?![\w.])')
+
+
+class Plans:
+    path = os.path.join(os.path.expanduser('~'), '.cache', 'squll', 'plans.json')
+    store = None
+
+    @staticmethod
+    def strip(plan):
+        # Remove the estimates from a parsed JSON plan
+        if isinstance(plan, dict):
+            return {k: Plans.strip(v) for k, v in plan.items() if not ESTIMATES.search(k)}
+        if isinstance(plan, list):
+            return [Plans.strip(v) for v in plan]
+        return plan
+
+    @staticmethod
+    def normalize(text):
+        try:
+            text = json.dumps(Plans.strip(json.loads(text)), sort_keys=True, indent=1)
+        except ValueError:
+            # comment lines carry the optimizer timings
+            text = '\n'.join(line.rstrip() for line in text.splitlines() if not line.lstrip().startswith('#'))
+        text = COSTS.sub('', text)
+        text = STRINGS.sub('?', text)
+        text = TYPED.sub(r'\1 ?', text)
+        return NUMBERS.sub('?', text)
+
+    @staticmethod
+    def load():
+        if Plans.store is None:
+            Plans.store = {}
+            try:
+                with open(Plans.path, 'r') as f:
+                    Plans.store = json.load(f)
+            except (OSError, ValueError) as msg:
+                if os.path.exists(Plans.path):
+                    logging.error(f'Ignore the plan store {Plans.path}: {msg}')
+        return Plans.store
+
+    @staticmethod
+    def save():
+        os.makedirs(os.path.dirname(Plans.path), exist_ok=True)
+        tmp = Plans.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(Plans.store, f)
+        os.replace(tmp, Plans.path)
+
+    @staticmethod
+    def record(key, text):
+        """
+        Hash the plan of a query and compare it with the one seen before.
+        :param key: the identity of the query, e.g. the experiment and the query text
+        :param text: the plan as produced by the engine
+        :return: {'hash', 'text'} with 'flip' set to the previous hash when the plan changed
+        """
+        normal = Plans.normalize(text)
+        digest = hashlib.sha1(normal.encode('utf-8')).hexdigest()
+        plan = {'hash': digest, 'text': text}
+        try:
+            store = Plans.load()
+            key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+            previous = store.get(key)
+            if previous and previous['hash'] != digest:
+                plan['flip'] = previous['hash']
+                logging.warning(f'Plan changed from {previous["hash"][:12]} to {digest[:12]}')
+            if not previous or previous['hash'] != digest:
+                store[key] = {'hash': digest, 'seen': time.time()}
+                Plans.save()
+        except OSError as msg:
+            logging.error(f'Plan store not available: {msg}')
+        return plan
+
+    @staticmethod
+    def groups(results):
+        # The parameters of the variants per plan hash
+        groups = {}
+        for res in results:
+            if 'plan' in res:
+                groups.setdefault(res['plan']['hash'], []).append(res['param'])
+        return groups
@@ -8,64 +8,93 @@ Copyright 2019- Stichting Sqalpel
 Author: M Kersten
 
 The prototypical driver to run a Sqalpel experiment and report on it.
+The server time of a run is the growth of the pg_stat_statements entry of the query,
+found through the query identifier of PostgreSQL 14 and later.
+The query plan is captured with EXPLAIN (FORMAT JSON).
 """
 
-import psycopg2
+import json
 import logging
 
+import psycopg2
+
+from src.drivers.dbapi import DBAPIDriver
+
 
-class Postgresql:
+class Postgresql(DBAPIDriver):
+    error = psycopg2.DatabaseError
 
     @staticmethod
-    def run(sqalpel):
-        """
-        :param sqalpel:
-        :return:
-        """
+    def connect(sqalpel):
+        return psycopg2.connect(host='localhost', port=5432, database=sqalpel.db)
 
-        # Establish a clean connection
-        try:
-            conn = psycopg2.connect(host='localhost', port=5432, database=sqalpel.db)
-        except (Exception, psycopg2.DatabaseError()) as msg:
-            sqalpel.error = msg
-            logging.error(f"EXCEPTION {msg}")
-            return
+    @staticmethod
+    def limit(sqalpel, conn, seconds):
+        c = conn.cursor()
+        c.execute(f'SET statement_timeout = {int(seconds * 1000)}')
+        c.close()
+        # outside the transaction, a cancelled query should not roll it back
+        conn.commit()
 
-        # Collects all variants of an experiment
-        for before, query, after in sqalpel.generate():
+    @staticmethod
+    def cancel(sqalpel, conn):
+        conn.cancel()
 
-            # Process all experiments multiple times
-            try:
-                for i in range(sqalpel.runlength):
-                    c = conn.cursor()
-                    if before:
-                        c.execute(before)
-
-                    sqalpel.start()
-                    c.execute(query)
-                    sqalpel.done()
-                    try:
-                        # if we have a result set, then obtain first row to represent it
-                        r = c.fetchone()
-                        if r:
-                            sqalpel.keep(r)
-                        else:
-                            sqalpel.keep('')
-                    except (Exception, psycopg2.DatabaseError) as e:
-                        sqalpel.error = e
-
-                    if after:
-                        c.execute(after)
-
-                    c.close()
+    @classmethod
+    def explain(cls, sqalpel, conn, query):
+        c = conn.cursor()
+        try:
+            c.execute('EXPLAIN (FORMAT JSON) ' + query)
+            plan = c.fetchone()[0]
+        finally:
+            c.close()
+            conn.rollback()
+        return plan if isinstance(plan, str) else json.dumps(plan, indent=1)
 
-            except (Exception, psycopg2.DatabaseError) as msg:
-                logging.error(f'EXCEPTION  {msg}')
-                sqalpel.error = str(msg).replace("\n", " ").replace("'", "''")
+    @classmethod
+    def probe(cls, sqalpel, conn, query):
+        c = conn.cursor()
+        try:
+            c.execute('EXPLAIN (VERBOSE, FORMAT JSON) ' + query)
+            plan = c.fetchone()[0]
+            queryid = (plan[0] if isinstance(plan, list) else {}).get('Query Identifier')
+            conn.rollback()
+        except (Exception, psycopg2.DatabaseError) as msg:
+            conn.rollback()
+            logging.info(f'No server time available: {msg}')
+            return None
+        finally:
+            c.close()
+        if queryid is None:
+            logging.info('No server time available, compute_query_id is off')
+            return None
+
+        def statistics():
+            c = conn.cursor()
+            c.execute('SELECT sum(total_exec_time), sum(calls), sum(rows), sum(shared_blks_hit), sum(shared_blks_read) '
+                      'FROM pg_stat_statements WHERE queryid = %s', (queryid,))
+            row = c.fetchone()
+            c.close()
+            return [float(v or 0) for v in row]
 
-        # Establish a clean wrapup
         try:
-            conn.close()
-        except (Exception,  psycopg2.DatabaseError) as msg:
-            sqalpel.error = msg
-            logging.error(f"EXCEPTION {msg}")
+            last = [statistics()]
+        except (Exception, psycopg2.DatabaseError) as msg:
+            conn.rollback()
+            logging.info(f'No server time available: {msg}')
+            return None
+
+        def delta():
+            try:
+                now = statistics()
+            except (Exception, psycopg2.DatabaseError) as msg:
+                conn.rollback()
+                logging.info(f'No server time available: {msg}')
+                return {}
+            diff = [n - o for n, o in zip(now, last[0])]
+            last[0] = now
+            if not diff[1]:
+                return {}
+            return {'elapsed': diff[0], 'calls': int(diff[1]), 'rows': int(diff[2]),
+                    'blks_hit': int(diff[3]), 'blks_read': int(diff[4])}
+        return delta
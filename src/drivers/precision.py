@@ -0,0 +1,70 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+Confidence intervals over the response times of a variant.
+The mean uses a Student-t interval, the median a distribution-free interval
+based on order statistics. Both only need the standard library.
+"""
+
+import math
+
+
+class Precision:
+
+    @staticmethod
+    def zvalue(confidence):
+        # Two-sided standard normal quantile, found by bisection on erf
+        lo, hi = 0.0, 10.0
+        for _ in range(60):
+            mid = (lo + hi) / 2
+            if math.erf(mid / math.sqrt(2)) < confidence:
+                lo = mid
+            else:
+                hi = mid
+        return (lo + hi) / 2
+
+    @staticmethod
+    def tvalue(confidence, df):
+        # Cornish-Fisher expansion of the Student-t quantile around the normal one
+        z = Precision.zvalue(confidence)
+        return (z + (z ** 3 + z) / (4 * df)
+                + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+                + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3))
+
+    @staticmethod
+    def interval(values, statistic='median', confidence=0.95):
+        """
+        :return: (center, low, high) of the confidence interval, or None for too few values
+        """
+        n = len(values)
+        if n < 2:
+            return None
+        if statistic == 'mean':
+            mean = sum(values) / n
+            sd = math.sqrt(sum([(v - mean) ** 2 for v in values]) / (n - 1))
+            half = Precision.tvalue(confidence, n - 1) * sd / math.sqrt(n)
+            return mean, mean - half, mean + half
+
+        x = sorted(values)
+        median = (x[(n - 1) // 2] + x[n // 2]) / 2
+        z = Precision.zvalue(confidence)
+        j = max(1, int(round(n / 2 - z * math.sqrt(n) / 2)))
+        k = min(n, int(round(1 + n / 2 + z * math.sqrt(n) / 2)))
+        return median, x[j - 1], x[k - 1]
+
+    @staticmethod
+    def relative(values, statistic='median', confidence=0.95):
+        # The half-width of the interval relative to its center
+        ci = Precision.interval(values, statistic, confidence)
+        if ci is None:
+            return None
+        center, lo, hi = ci
+        if center == 0:
+            return 0.0 if hi == lo else math.inf
+        return (hi - lo) / 2 / abs(center)
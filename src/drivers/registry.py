@@ -0,0 +1,98 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+The registry maps a DBMS name onto the module and class of its driver.
+A driver module, and thereby its client library, is only imported when a task
+first needs it. A worker for a single DBMS therefore does not pay for (or fail on)
+the client libraries of all the others.
+
+The built-in map can be extended with the 'registry' section of the configuration
+file, or by packages that advertise a 'squll.drivers' entry point, e.g.
+    registry:
+        duckdb: mydrivers.duckdb:DuckDB
+"""
+
+import importlib
+import logging
+
+DRIVERS = {
+    'monetdb': 'src.drivers.monetdb:MonetDB',
+    'postgresql': 'src.drivers.postgresql:Postgresql',
+    'clickhouse': 'src.drivers.clickhouse_driver:ClickhouseDriver',
+    'sqlite': 'src.drivers.sqlite:Sqlite',
+    'actian': 'src.drivers.actian_client_driver:ActianClientDriver',  # the terminal monitor ql
+    'mclient': 'src.drivers.monetdb_client_driver:MonetDBClientDriver',
+    'ingres': 'src.drivers.actian:Actian',  # Actian over ingresdbi, not in the Pipfile
+    'mariadb': 'src.drivers.mariadb:MariaDB',
+    'firebird': 'src.drivers.firebird_driver:FirebirdDriver',
+    'apache derby': 'src.jdbc.jdbc_implementations:ApacheDerbyJDBCDriver',
+    'derby': 'src.jdbc.jdbc_implementations:ApacheDerbyJDBCDriver',
+    'apache hive': 'src.jdbc.jdbc_implementations:ApacheHiveJDBCDriver',
+    'hive': 'src.jdbc.jdbc_implementations:ApacheHiveJDBCDriver',
+    'h2': 'src.jdbc.jdbc_implementations:H2JDBCDriver',
+    'hsqldb': 'src.jdbc.jdbc_implementations:HSQLDBJDBCDriver',
+    'monetdblite-java': 'src.jdbc.jdbc_implementations:MonetDBLiteJDBCDriver',
+}
+
+
+class Registry:
+    drivers = dict(DRIVERS)
+    loaded = {}
+
+    @staticmethod
+    def register(name, path):
+        Registry.drivers[name.lower()] = path
+        Registry.loaded.pop(name.lower(), None)
+
+    @staticmethod
+    def configure(config):
+        """
+        Extend the registry with the installed entry points and the 'registry'
+        section of the configuration file. The latter takes precedence.
+        """
+        try:
+            from importlib.metadata import entry_points
+            eps = entry_points()
+            eps = eps.select(group='squll.drivers') if hasattr(eps, 'select') else eps.get('squll.drivers', [])
+            for ep in eps:
+                Registry.register(ep.name, ep.value)
+        except ImportError:
+            pass
+        for name, path in (config or {}).get('registry', {}).items():
+            Registry.register(name, path)
+
+    @staticmethod
+    def lookup(name):
+        # Import the driver class on first use
+        name = name.lower()
+        if name not in Registry.loaded:
+            if name not in Registry.drivers:
+                return None
+            module, cls = Registry.drivers[name].split(':')
+            try:
+                Registry.loaded[name] = getattr(importlib.import_module(module), cls)
+            except (ImportError, AttributeError) as msg:
+                logging.error(f'Driver {name} can not be loaded: {msg}')
+                return None
+        return Registry.loaded[name]
+
+    @staticmethod
+    def runner(name):
+        """
+        Return the callable that runs a task for the DBMS.
+        JDBC implementations are wrapped into the generic JDBC driver,
+        configured by the driver section of the task.
+        """
+        driver = Registry.lookup(name)
+        if driver is None:
+            return None
+        if hasattr(driver, 'get_java_driver_class'):
+            from src.jdbc.jdbc_driver import JDBCDriver
+            return lambda sqalpel: JDBCDriver.launch(sqalpel, driver)
+        return driver.run
@@ -8,8 +8,13 @@ Copyright 2019- Stichting Sqalpel
 Author: M Kersten
 The sqalpel.yaml file can be inspected for local processing.
 Use of pyyaml 5.1 is required for plugging an exploit
+
+Remote repositories are mirrored in a local content store and revalidated
+using the ETag of each file. Repositories can also be given as a file:// URL
+or a plain directory.
 """
 import logging
+import os
 import urllib.parse
 
 import requests
@@ -18,9 +23,22 @@ import yaml
 
 class Repository:
     debug = False
+    # local content store of the experiment repositories
+    cache = os.path.join(os.path.expanduser('~'), '.cache', 'squll', 'repositories')
+    # the YAML files are parsed once per process
+    parsed = {}
+    session = None
+
+    @staticmethod
+    def islocal(url):
+        return url.startswith('file://') or os.path.isdir(url)
 
     @staticmethod
     def isvalid(url):
+        if Repository.islocal(url):
+            res = os.path.isdir(Repository.localpath(url))
+            logging.info(f"Valid directory {url}" if res else f"Invalid directory {url}")
+            return res
         res = True
         try:
             o = urllib.parse.urlparse(url)
@@ -40,88 +58,114 @@ class Repository:
         return res
 
     @staticmethod
-    def get_yaml(repro, file):
-        logging.info(f'{repro},{file}')
-        if not Repository.isvalid(repro):
-            return None
+    def localpath(url):
+        if url.startswith('file://'):
+            return urllib.parse.unquote(urllib.parse.urlparse(url).path)
+        return url
+
+    @staticmethod
+    def fetch(repro, file):
+        """
+        Return the text of a file in the repository.
+        Local repositories are read directly. Remote files are kept in the content store
+        and revalidated with their ETag; when the server can not be reached the stored
+        copy is used, which permits offline runs.
+        """
+        if Repository.islocal(repro):
+            path = os.path.join(Repository.localpath(repro), file)
+            try:
+                with open(path, 'r') as f:
+                    return f.read()
+            except OSError as msg:
+                if Repository.debug:
+                    logging.error(f'FAILED {path} {msg}')
+                return None
+
         try:
             o = urllib.parse.urlparse(repro)
-            if Repository.debug:
-                logging.info(f"parsed {o}")
         except ValueError as msg:
             if Repository.debug:
-                logging.error(f'Invalid yaml url {file} {msg}')
+                logging.error(f'Invalid url {repro} {msg}')
             return None
         url = f"https://raw.githubusercontent.com{o.path[:-4]}/master/{file}"
+        path = os.path.join(Repository.cache, o.netloc, o.path[1:-4], file)
+        etag = None
+        if os.path.exists(path) and os.path.exists(path + '.etag'):
+            with open(path + '.etag', 'r') as f:
+                etag = f.read().strip()
+
         if Repository.debug:
             logging.info(f"URL retrieved {url}")
-        result = requests.get(url)
-        if result:
+        if Repository.session is None:
+            Repository.session = requests.Session()
+        try:
+            result = Repository.session.get(url, headers={'If-None-Match': etag} if etag else {}, timeout=20)
+        except requests.exceptions.RequestException as msg:
+            logging.error(f'REQUESTS exception {msg}, use cached {path}')
+            result = None
+
+        if result is not None and result.status_code == 200:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                f.write(result.text)
+            os.replace(path + '.tmp', path)
+            if result.headers.get('ETag'):
+                with open(path + '.etag', 'w') as f:
+                    f.write(result.headers['ETag'])
+            return result.text
+        if result is not None and result.status_code != 304:
             if Repository.debug:
-                logging.info(f"result{result.text}")
-            try:
-                p = yaml.load(result.text)
-            except yaml.YAMLError as msg:
-                logging.error(msg)
-                return None
-            return p
-        if Repository.debug:
-            logging.info(f"FAILED {result} {url}")
+                logging.info(f"FAILED {result} {url}")
+            return None
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return f.read()
         return None
 
     @staticmethod
-    def parse_yaml(repro, file):
-        logging.info(f"{repro},{file}")
-        try:
-            o = urllib.parse.urlparse(repro)
-            if Repository.debug:
-                logging.info(f"parsed {o}")
-        except yaml.YAMLError as msg:
-            if Repository.debug:
-                logging.error(f'Invalid yaml url {file} {msg}')
-            return {'parse_error': msg}
-        url = f"https://raw.githubusercontent.com{o.path[:-4]}/master/{file}"
-        if Repository.debug:
-            logging.info(f"URL retrieved {url}")
-        result = requests.get(url)
-        if result:
+    def load(repro, file):
+        # Parse a YAML file of the repository only once
+        key = (repro, file)
+        if key not in Repository.parsed:
+            text = Repository.fetch(repro, file)
+            if text is None:
+                return None
             if Repository.debug:
-                logging.info(f"result{result.text}")
+                logging.info(f"result{text}")
             try:
-                p = yaml.load(result.text)
+                Repository.parsed[key] = yaml.safe_load(text)
             except yaml.YAMLError as msg:
                 logging.error(msg)
                 return {'parse_error': msg}
-            return p
-        if Repository.debug:
-            logging.info(f"FAILED {result} {url}")
-        return None
+        return Repository.parsed[key]
 
     @staticmethod
-    def get_documentation(repro):
-        if not repro:
+    def get_yaml(repro, file):
+        logging.info(f'{repro},{file}')
+        if not Repository.isvalid(repro):
+            return None
+        p = Repository.load(repro, file)
+        if p and 'parse_error' in p:
             return None
+        return p
 
-        try:
-            o = urllib.parse.urlparse(repro)
-            if Repository.debug:
-                logging.info(f"parsed {o}")
-        except ValueError as msg:
-            if Repository.debug:
-                logging.error(f'Invalid yaml url {repro} {msg}')
+    @staticmethod
+    def parse_yaml(repro, file):
+        logging.info(f"{repro},{file}")
+        return Repository.load(repro, file)
+
+    @staticmethod
+    def get_documentation(repro):
+        if not repro:
             return None
         y = Repository.parse_yaml(repro, 'sqalpel.yaml')
         if not y:
             return None
         if y['documentation']:
-            url = f"https://raw.githubusercontent.com{o.path[:-4]}/master/{y['documentation']}"
-            if Repository.debug:
-                logging.info(f"Retrieve documentation from url {url}")
-            result = requests.get(url)
-            if result:
-                if Repository.debug:
-                    logging.info(result.text)
-                return result.text
+            text = Repository.fetch(repro, y['documentation'])
+            if text and Repository.debug:
+                logging.info(text)
+            return text
         return None
 
     @staticmethod
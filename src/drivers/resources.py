@@ -0,0 +1,193 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+The resource usage of the database server during a single run.
+The counters of /proc are read at the start and the end of a run, outside its timed
+window. A background thread samples the resident set size and the available memory
+in between to catch their peaks. The server process is taken from the 'resources'
+entry of the driver section, e.g.
+    resources:
+        process: mserver5       # or pid: 1234, or pidfile: /path/to/server.pid
+        children: True          # include the child processes, e.g. PostgreSQL backends
+        interval: 0.01          # seconds between the samples
+Without a server process only the system wide counters are reported.
+It relies on the Linux /proc file system; elsewhere the metrics remain empty.
+"""
+
+import logging
+import os
+import threading
+
+TICK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+class Resources:
+
+    def __init__(self):
+        self.root = None
+        self.children = False
+        self.interval = 0.01
+        self.pids = []
+        self.first = None
+        self.peak = 0
+        self.avail = None
+        self.lock = threading.Lock()
+        self.active = threading.Event()
+        self.stop = threading.Event()
+        self.thread = None
+
+    @staticmethod
+    def read(path):
+        try:
+            with open(path, 'r') as f:
+                return f.read()
+        except (OSError, IOError):
+            return ''
+
+    @staticmethod
+    def stat(pid):
+        # The fields following the command name, which may contain blanks itself
+        text = Resources.read(f'/proc/{pid}/stat')
+        return text.rsplit(')', 1)[1].split() if ')' in text else []
+
+    @staticmethod
+    def discover(spec):
+        """
+        :return: the pid of the server process described by the driver section, or None
+        """
+        if spec.get('pid'):
+            return int(spec['pid'])
+        if spec.get('pidfile'):
+            text = Resources.read(spec['pidfile']).split()
+            return int(text[0]) if text and text[0].isdigit() else None
+        if spec.get('process'):
+            # the oldest process with the name is the server itself
+            found = []
+            for pid in filter(str.isdigit, os.listdir('/proc') if os.path.isdir('/proc') else []):
+                if Resources.read(f'/proc/{pid}/comm').strip() == spec['process']:
+                    fields = Resources.stat(pid)
+                    if fields:
+                        found.append((int(fields[19]), int(pid)))
+            if found:
+                return min(found)[1]
+            logging.error(f"No server process {spec['process']} found")
+        return None
+
+    def configure(self, spec):
+        self.interval = float(spec.get('interval', 0.01))
+        self.children = bool(spec.get('children', False))
+        self.root = Resources.discover(spec)
+
+    def processes(self):
+        if self.root is None:
+            return []
+        pids = [self.root]
+        if self.children:
+            for pid in filter(str.isdigit, os.listdir('/proc')):
+                fields = Resources.stat(pid)
+                if fields and int(fields[1]) == self.root:
+                    pids.append(int(pid))
+        return pids
+
+    @staticmethod
+    def memory(pids):
+        # The resident set size of the processes and the available memory in bytes
+        rss = 0
+        for pid in pids:
+            for line in Resources.read(f'/proc/{pid}/status').splitlines():
+                if line.startswith('VmRSS:'):
+                    rss += int(line.split()[1]) * 1024
+        avail = None
+        for line in Resources.read('/proc/meminfo').splitlines():
+            if line.startswith('MemAvailable:'):
+                avail = int(line.split()[1]) * 1024
+        return rss, avail
+
+    def snapshot(self):
+        snap = {'user': 0, 'sys': 0, 'oncpu': 0, 'read': 0, 'write': 0, 'vctx': 0, 'nvctx': 0}
+        fields = Resources.read('/proc/stat').split('\n', 1)[0].split()[1:]
+        ticks = [int(f) for f in fields]
+        snap['total'] = sum(ticks[:8])
+        snap['idle'] = sum(ticks[3:5])
+        snap['iowait'] = ticks[4] if len(ticks) > 4 else 0
+        for pid in self.pids:
+            fields = Resources.stat(pid)
+            if not fields:
+                continue
+            snap['user'] += int(fields[11])
+            snap['sys'] += int(fields[12])
+            sched = Resources.read(f'/proc/{pid}/schedstat').split()
+            if sched:
+                snap['oncpu'] += int(sched[0])
+            for line in Resources.read(f'/proc/{pid}/io').splitlines():
+                if line.startswith('read_bytes:'):
+                    snap['read'] += int(line.split()[1])
+                elif line.startswith('write_bytes:'):
+                    snap['write'] += int(line.split()[1])
+            for line in Resources.read(f'/proc/{pid}/status').splitlines():
+                if line.startswith('voluntary_ctxt_switches:'):
+                    snap['vctx'] += int(line.split()[1])
+                elif line.startswith('nonvoluntary_ctxt_switches:'):
+                    snap['nvctx'] += int(line.split()[1])
+        return snap
+
+    def sample(self):
+        rss, avail = Resources.memory(self.pids)
+        with self.lock:
+            self.peak = max(self.peak, rss)
+            if avail is not None:
+                self.avail = avail if self.avail is None else min(self.avail, avail)
+
+    def loop(self):
+        while True:
+            self.active.wait()
+            while not self.stop.wait(self.interval):
+                self.sample()
+
+    def begin(self):
+        # Called just before the timed window of a run
+        self.pids = self.processes()
+        self.first = self.snapshot()
+        with self.lock:
+            self.peak = 0
+            self.avail = None
+        self.sample()
+        self.stop.clear()
+        self.active.set()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.loop, daemon=True)
+            self.thread.start()
+
+    def end(self):
+        """
+        Called just after the timed window of a run
+        :return: the resource usage of the run
+        """
+        self.active.clear()
+        self.stop.set()
+        last = self.snapshot()
+        self.sample()
+        first = self.first
+        total = last['total'] - first['total']
+        usage = {'user': (last['user'] - first['user']) * 1000 / TICK,
+                 'sys': (last['sys'] - first['sys']) * 1000 / TICK,
+                 'oncpu': (last['oncpu'] - first['oncpu']) / 1000000,
+                 'rss': self.peak,
+                 'read': last['read'] - first['read'],
+                 'write': last['write'] - first['write'],
+                 'vctx': last['vctx'] - first['vctx'],
+                 'nvctx': last['nvctx'] - first['nvctx'],
+                 'cpu': (total - (last['idle'] - first['idle'])) / total if total else 0.0,
+                 'iowait': (last['iowait'] - first['iowait']) / total if total else 0.0,
+                 'memavail': self.avail}
+        if not self.pids:
+            # only the system wide counters are known
+            for k in ('user', 'sys', 'oncpu', 'rss', 'read', 'write', 'vctx', 'nvctx'):
+                del usage[k]
+        return usage
@@ -0,0 +1,174 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+Sampling strategies for large parameter spaces.
+The full product of the parameter value lists quickly grows beyond what can be run,
+e.g. five parameters with 20 values each give 3.2M variants. A sampler lazily yields
+a bounded number of distinct combinations that cover the space.
+
+The task options select the strategy:
+    "sampler": "product"      the full product in its natural order (default)
+               "uniform"      uniform random without replacement
+               "lhs"          Latin hypercube, each value range divided in 'budget' strata
+               "sobol"        low-discrepancy Sobol sequence (up to 16 parameters)
+               "stratified"   every value of each parameter is used equally often
+    "seed": 1                 makes the sample reproducible
+    "budget": 500             the maximal number of variants
+"""
+
+import itertools
+import logging
+import random
+
+# Direction numbers (s, a, m) of the Sobol sequence by Joe and Kuo for dimensions 2..16
+SOBOL = [
+    (1, 0, [1]),
+    (2, 1, [1, 3]),
+    (3, 1, [1, 3, 1]),
+    (3, 2, [1, 1, 1]),
+    (4, 1, [1, 1, 3, 3]),
+    (4, 4, [1, 3, 5, 13]),
+    (5, 2, [1, 1, 5, 5, 17]),
+    (5, 4, [1, 1, 5, 5, 5]),
+    (5, 7, [1, 1, 7, 11, 19]),
+    (5, 11, [1, 1, 5, 1, 1]),
+    (5, 13, [1, 1, 1, 3, 11]),
+    (5, 14, [1, 3, 5, 5, 31]),
+    (6, 1, [1, 3, 3, 9, 7, 49]),
+    (6, 13, [1, 1, 1, 15, 21, 21]),
+    (6, 16, [1, 3, 1, 13, 27, 49]),
+]
+BITS = 32
+
+
+class Samplers:
+
+    @staticmethod
+    def make(options, data):
+        """
+        :param options: the task options
+        :param data: the list of value lists, one per parameter
+        :return: an iterator over the value combinations
+        """
+        sizes = [len(d) for d in data]
+        total = 1
+        for s in sizes:
+            total *= s
+        method = options.get('sampler', 'product')
+        seed = options.get('seed', 1)
+        if method in ('product', 'uniform'):
+            budget = int(options.get('budget', total))
+        else:
+            budget = int(options.get('budget', max(sizes or [1])))
+        budget = min(budget, total)
+
+        if method == 'sobol' and len(sizes) > len(SOBOL) + 1:
+            logging.error(f'Sobol sampling supports at most {len(SOBOL) + 1} parameters, use uniform sampling')
+            method = 'uniform'
+        if method == 'product':
+            return itertools.islice(itertools.product(*data), budget)
+        if method == 'uniform':
+            indices = Samplers.uniform(total, budget, seed, sizes)
+        elif method == 'lhs':
+            indices = Samplers.lhs(sizes, budget, seed)
+        elif method == 'sobol':
+            indices = Samplers.sobol(sizes, budget, seed)
+        elif method == 'stratified':
+            indices = Samplers.stratified(sizes, budget, seed)
+        else:
+            logging.error(f'Unknown sampler {method}, use the full product')
+            return itertools.islice(itertools.product(*data), budget)
+        return (tuple(d[i] for d, i in zip(data, idx)) for idx in Samplers.distinct(indices, budget))
+
+    @staticmethod
+    def distinct(indices, budget):
+        # Drop repeated combinations and stop at the budget
+        seen = set()
+        misses = 0
+        for idx in indices:
+            if len(seen) >= budget:
+                return
+            idx = tuple(idx)
+            if idx in seen:
+                # give up when the sampler hardly finds new combinations
+                misses += 1
+                if misses > 10 * budget + 1000:
+                    logging.info(f'Sampling stopped after {len(seen)} variants')
+                    return
+                continue
+            seen.add(idx)
+            yield idx
+
+    @staticmethod
+    def decode(i, sizes):
+        # Map a position in the product onto the value indices, last parameter fastest
+        idx = []
+        for s in reversed(sizes):
+            idx.append(i % s)
+            i //= s
+        return idx[::-1]
+
+    @staticmethod
+    def uniform(total, budget, seed, sizes):
+        rnd = random.Random(seed)
+        if budget * 2 >= total:
+            # a dense sample is cheaper as a permutation
+            for i in rnd.sample(range(total), total):
+                yield Samplers.decode(i, sizes)
+            return
+        while True:
+            yield Samplers.decode(rnd.randrange(total), sizes)
+
+    @staticmethod
+    def lhs(sizes, budget, seed):
+        rnd = random.Random(seed)
+        while True:
+            # each round places one point in every stratum of every parameter
+            perms = [rnd.sample(range(budget), budget) for _ in sizes]
+            for i in range(budget):
+                yield [int((p[i] + rnd.random()) / budget * s) for p, s in zip(perms, sizes)]
+
+    @staticmethod
+    def directions(dim):
+        if dim == 0:
+            return [1 << (BITS - 1 - k) for k in range(BITS)]
+        s, a, m = SOBOL[dim - 1]
+        v = [m[k] << (BITS - 1 - k) for k in range(s)]
+        for k in range(s, BITS):
+            x = v[k - s] ^ (v[k - s] >> s)
+            for j in range(1, s):
+                x ^= ((a >> (s - 1 - j)) & 1) * v[k - j]
+            v.append(x)
+        return v
+
+    @staticmethod
+    def sobol(sizes, budget, seed):
+        rnd = random.Random(seed)
+        dirs = [Samplers.directions(d) for d in range(len(sizes))]
+        # a random digital shift keeps the low-discrepancy property and honors the seed
+        x = [rnd.getrandbits(BITS) for _ in sizes]
+        i = 0
+        while i < 1 << BITS:
+            yield [(xd * s) >> BITS for xd, s in zip(x, sizes)]
+            # Gray code order, flip the direction of the lowest zero bit of i
+            c = (~i & (i + 1)).bit_length() - 1
+            x = [xd ^ v[c] for xd, v in zip(x, dirs)]
+            i += 1
+
+    @staticmethod
+    def stratified(sizes, budget, seed):
+        rnd = random.Random(seed)
+        perms = [[] for _ in sizes]
+        while True:
+            idx = []
+            for d, s in enumerate(sizes):
+                if not perms[d]:
+                    perms[d] = rnd.sample(range(s), s)
+                idx.append(perms[d].pop())
+            yield idx
@@ -13,23 +13,75 @@ and return a list of timings. The first error encountered aborts the sequence.
 The result is a list of dictionaries
 run: [{
     times: [<response time>]
+    phases: {before: [ns], execute: [ns], first: [ns], fetch: [ns], after: [ns]}
     chks: [<integer value to represent result (e.g. cnt,  checksum or hash over result set) >]
     param: {param1:value1, ....}
     errors: []
+    outcome: ok | error | timeout | pruned (implied timeout)
+    summary: {n, min, max, median, mean, std, mad, p90, p95, p99, trimmed, iqr, outliers}
+    series: {cold: [<response time>], warmup: [<response time>]}
+    plan: {hash, text, flip}
     }]
 
-If parameter value lists are given, we run the query for each element in the product.
+The response times are measured with a monotonic nanosecond clock. Each run is split
+into the phases listed in PHASES, reported in nanoseconds. The 'times' list remains the
+compatibility view and holds the execution phase in (fractional) milliseconds.
+The summary is computed on the client. With the option "raw": false the individual
+samples are left out, which keeps the uploads of long runs small.
 
-Internal metrics, e.g. cpu load, is returned as a JSON structure in 'metrics' column
+The run protocol of a variant starts with the 'cold' runs, each preceded by the cache
+flush hook of the driver section, followed by the 'warmup' runs. Both are reported as
+separate series, the measured (hot) runs remain in 'times'.
 
+In fingerprint mode (option 'fingerprint') the complete result set is streamed using fetchmany
+batches of 'arraysize' rows. The chksum then becomes an order-insensitive 64-bit hash over all rows
+and the row count and fetch throughput are reported per run in 'fingerprint'.
+
+If parameter value lists are given, we run the query for each element in the product,
+or for a bounded sample of it when the task options select a sampler.
+A run that exceeds the timeout is cancelled by a watchdog. It first uses the native
+mechanism of the driver and falls back to closing the connection. The variant is then
+reported with the outcome 'timeout' and the experiment continues with the next one.
+Parameters listed in the 'monotone' option are assumed to grow in cost with their value.
+Once a variant times out, all variants that are at least as costly are skipped and
+reported with the outcome 'pruned (implied timeout)'.
+
+Internal metrics, e.g. cpu load, is returned as a JSON structure in 'metrics' column.
+With a 'resources' entry in the driver section the CPU, memory, I/O and context switches
+of the database server are reported per measured run in metrics['resources'].
+With the option "plan": true the query plan of each variant is captured before its runs,
+between an extra untimed execution of its prelude and postlude.
+The plan hash groups the variants by plan and 'flip' holds the hash seen before for the
+same query of the experiment, when the plan changed since.
+
+The webserver is contacted through a pooled keep-alive session. Multiple tasks can be
+leased in a single get_work request ('batch') and multiple task results are posted
+as a gzip compressed {'batch': [...]} body ('upload'). With a pipeline attached the
+requests are handled in the background, outside the timed windows of start()/done().
+With an outbox attached each result is first written to a durable local journal, the
+outbox then uploads the journal in batches of 'upload' results.
 """
 import requests
+import gzip
+import hashlib
 import json
 import os
-import re
+import subprocess
 import time
-import itertools
 import logging
+from urllib3.util.retry import Retry
+
+from src.drivers.connections import ConnectionCache
+from src.drivers.plans import Plans
+from src.drivers.precision import Precision
+from src.drivers.resources import Resources
+from src.drivers.samplers import Samplers
+from src.drivers.summary import Summary
+from src.drivers.template import Template
+from src.drivers.watchdog import Watchdog
+
+# The phases of a single run in the order the drivers pass through them
+PHASES = ('before', 'execute', 'first', 'fetch', 'after')
 
 
 class Sqalpel:
@@ -42,6 +94,9 @@ class Sqalpel:
     dbms = None
     host = None
     timeout = None
+    target = {}    # the driver section of the configuration file
+    drivers = {}   # all driver sections of the configuration file
+    section = None  # the driver section to use instead of the one named after the task's DBMS
     memory = 0
     runlength = 1
     prelude = None
@@ -51,13 +106,46 @@ class Sqalpel:
     error = None
     data = None
     names = None
+    templates = None
     gen = None
     args = None
     ticks = None
+    lap = None
+    run = None
     times = []
+    phases = {}
+    fingerprint = False
+    arraysize = 1000
+    concurrency = None
+    openloop = None
+    fresh = False
+    adaptive = None     # statistical stopping rule for the repetitions
+    race = None         # successive halving over the variants
+    warmup = 0          # runs before the measurements, reported separately
+    cold = 0            # runs preceded by the cache flush hook of the driver section
+    label = None        # the series of the current run, None for a measured one
+    series = {}
+    plan = None         # the query plan of the current variant as produced by the engine
+    resources = None    # the 'resources' entry of the driver section when sampling
+    sampler = None
+    monotone = None     # parameters whose cost grows with their value
+    timedout = False
+    watchdog = None     # cancels a run that exceeds the timeout
+    cancel = []         # the actions of the watchdog for the current connection
+    driver = None       # the driver class of the current task
+    conn = None         # the connection of the current variant, renewed after a server restart
+    connection = {}     # how the connection of the task was established
+    prints = []
     chks = []
     metrics = {}
     results = []
+    session = None
+    batch = 1       # tasks leased per get_work round trip
+    upload = 1      # task results combined in a single put_work body
+    leased = []
+    outgoing = []
+    pipeline = None     # background prefetch and upload of tasks
+    outbox = None       # durable journal of the task results
 
     def __init__(self, args):
         """
@@ -70,6 +158,10 @@ class Sqalpel:
         self.ticket = args.ticket
         self.timeout = args.timeout
         self.debug = args.debug
+        self.batch = int(getattr(args, 'batch', None) or 1)
+        self.upload = int(getattr(args, 'upload', None) or 1)
+        self.leased = []
+        self.outgoing = []
         if 'runlength' in args:
             self.runlength = int(args['runlength'])
         if 'prelude' in args:
@@ -92,6 +184,7 @@ class Sqalpel:
         self.error = None
         self.db = task['db']
         self.dbms = task['dbms']
+        self.target = self.configured(self.section or self.dbms)
         self.host = task['host']
         self.prelude = task['prelude']
         self.postlude = task['postlude']
@@ -99,96 +192,646 @@ class Sqalpel:
             e = json.loads(self.task['extras'])
             self.task.update(e)
         self.options = json.loads(task['options'])
+        if 'runlength' in self.options:
+            self.runlength = int(self.options['runlength'])
+        self.adaptive = self.options.get('adaptive')
+        self.warmup = int(self.options.get('warmup', 0))
+        self.cold = int(self.options.get('cold', 0))
+        self.race = self.options.get('race')
+        # parameters declared monotone in cost, ascending unless stated otherwise
+        self.monotone = self.options.get('monotone')
+        if isinstance(self.monotone, list):
+            self.monotone = {n: 'asc' for n in self.monotone}
+        self.fingerprint = bool(self.options.get('fingerprint', False))
+        self.arraysize = int(self.options.get('arraysize', Sqalpel.arraysize))
+        self.concurrency = self.options.get('concurrency')
+        self.openloop = self.options.get('openloop')
+        self.fresh = bool(self.options.get('fresh', False))
+        self.resources = None
+        spec = self.target.get('resources')
+        if self.options.get('resources', spec is not None):
+            self.resources = spec if isinstance(spec, dict) else {}
+            if self.sampler is None:
+                self.sampler = Resources()
+            # the server may have been restarted since the previous task
+            self.sampler.configure(self.resources)
+        self.connection = {}
         self.results = []
 
         if task['params']:
             self.data = [json.loads(task['params'][k]) for k in task['params'].keys()]
             self.names = [d for d in task['params'].keys()]
-            self.gen = itertools.product(*self.data)
+            # the full product or a bounded sample of it
+            self.gen = Samplers.make(self.options, self.data)
         else:
             self.gen = [[1]]
             self.names = ['_ * _']
+        # the query texts are parsed once for all variants
+        names = self.names if task['params'] else []
+        self.templates = [Template(t, names) for t in (task['query'], self.prelude, self.postlude)]
         logging.info(f"prepare {self.task}")
 
+    @staticmethod
+    def configured(name):
+        # The driver section of the configuration file, the names are case insensitive
+        for k, v in Sqalpel.drivers.items():
+            if k.lower() == str(name).lower():
+                return v or {}
+        return {}
+
     def keep(self, res):
         self.chks.append(res)
 
     def start(self):
-        self.ticks = time.time()
+        if self.pipeline:
+            self.pipeline.enter()
+        if self.resources is not None:
+            self.sampler.begin()
+        if self.cancel and self.timeout:
+            self.watchdog.arm(self.timeout, self.cancel)
+        self.ticks = time.perf_counter_ns()
+        self.lap = self.ticks
+        self.run = {}
+
+    def phase(self, name):
+        # Close the current phase of the run and start the next one
+        now = time.perf_counter_ns()
+        self.run[name] = self.run.get(name, 0) + now - self.lap
+        self.lap = now
 
     def done(self):
-        self.times.append(int((time.time() - self.ticks) * 1000))
+        now = time.perf_counter_ns()
+        if not self.run:
+            # a plain start/done pair only covers the query execution
+            self.run['execute'] = now - self.ticks
+        if self.cancel and self.timeout and self.watchdog.disarm():
+            # the cancellation came too late to stop the run
+            self.timedout = True
+        usage = self.sampler.end() if self.resources is not None else None
+        if self.label:
+            # cold and warm-up runs are no measurements
+            self.series.setdefault(self.label, []).append(self.run.get('execute', 0) / 1000000)
+        else:
+            for p in PHASES:
+                self.phases.setdefault(p, []).append(self.run.get(p, 0))
+            self.times.append(self.run.get('execute', 0) / 1000000)
+            if usage:
+                self.metrics.setdefault('resources', []).append(usage)
+        if self.timeout and now - self.ticks > self.timeout * 1000000000:
+            self.timedout = True
+        self.ticks = None
+        if self.pipeline:
+            self.pipeline.leave()
         if self.debug:
-            print(f"ticks {self.times[-1]}")
+            print(f"ticks {self.run.get('execute', 0) / 1000000} {self.run}")
+
+    def abort(self):
+        """
+        Stop the watchdog and the resource sampling of a run that ended in an exception.
+        Called once the failure is handled, it does nothing after done() or recover().
+        """
+        if self.ticks is None:
+            return
+        if self.cancel and self.timeout:
+            self.watchdog.disarm()
+        if self.resources is not None:
+            self.sampler.end()
+        self.ticks = None
+
+    def measure(self, name, value):
+        # A driver specific measurement of the current run, kept per measured run in metrics[name]
+        if not self.label:
+            self.metrics.setdefault(name, []).append(value)
+
+    def fetch(self, cursor):
+        if self.fingerprint:
+            self.digest(cursor)
+            return
+        # if we have a result set, then obtain first row to represent it
+        r = cursor.fetchone()
+        self.phase('first')
+        if r:
+            self.keep(r)
+            # a cursor may offer a cheaper way to consume the remainder
+            if hasattr(cursor, 'discard'):
+                cursor.discard()
+            else:
+                # drain in batches, the remainder is not kept
+                cursor.arraysize = self.arraysize
+                while cursor.fetchmany(self.arraysize):
+                    pass
+        else:
+            self.keep('')
+        self.phase('fetch')
+
+    def digest(self, cursor):
+        """
+        Stream the result set in batches and fold each row into a 64-bit hash.
+        The row hashes are added modulo 2^64, which makes the result independent of the row order
+        and keeps the memory footprint constant.
+        """
+        rows = 0
+        size = 0
+        chk = 0
+        cursor.arraysize = self.arraysize
+        batch = cursor.fetchmany(self.arraysize) if cursor.description else None
+        self.phase('first')
+        while batch:
+            for r in batch:
+                row = '\x1f'.join([str(v) for v in r]).encode('utf-8')
+                chk += int.from_bytes(hashlib.blake2b(row, digest_size=8).digest(), 'little')
+                size += len(row)
+            rows += len(batch)
+            batch = cursor.fetchmany(self.arraysize)
+        self.phase('fetch')
+
+        chk = f'{chk & 0xFFFFFFFFFFFFFFFF:016x}'
+        self.keep(chk)
+        elapsed = (self.run.get('first', 0) + self.run.get('fetch', 0)) / 1000000000
+        self.prints.append({'rows': rows,
+                            'hash': chk,
+                            'bytes': size,
+                            'rows/s': rows / elapsed if elapsed else 0,
+                            'bytes/s': size / elapsed if elapsed else 0})
+
+    def repetitions(self, conn=None):
+        """
+        Yield the run numbers of the current variant, following the run protocol
+            "cold": 3, "warmup": 2
+        The connection is needed for a cache flush hook that consists of SQL statements.
+        A hook that restarts the server replaces it, the driver picks up the new one from
+        self.conn before its next run.
+        """
+        self.conn = conn
+        for label, count in (('cold', self.cold), ('warmup', self.warmup)):
+            self.label = label
+            for i in range(count):
+                if self.error or self.timedout or (label == 'cold' and not self.coldstart(self.conn)):
+                    break
+                yield i
+        self.label = None
+        if not self.error and not self.timedout:
+            yield from self.measured()
+
+    def coldstart(self, conn):
+        """
+        Call the cache flush hook of the driver section before a cold run, e.g.
+            flush:
+                command: "sync; echo 3 | sudo tee /proc/sys/vm/drop_caches"
+                sql: "DISCARD ALL"
+                wait: 1
+        A plain string is taken as the command. The command may also restart the server,
+        'wait' then gives it time to come up. A connection that did not survive the command
+        is replaced by a new one. The hook is not part of the timed run.
+        The statements may reset the session, e.g. its statement timeout, which is
+        therefore set again afterwards.
+        """
+        hook = self.target.get('flush')
+        if not hook:
+            return True
+        if isinstance(hook, str):
+            hook = {'command': hook}
+        try:
+            if hook.get('command'):
+                subprocess.run(hook['command'].replace('{database}', self.db),
+                               shell=True, check=True, timeout=self.timeout or None)
+            if hook.get('wait'):
+                time.sleep(float(hook['wait']))
+            if hook.get('command') and conn is not None and \
+                    not ConnectionCache.healthy(conn, getattr(self.driver, 'ping', 'SELECT 1')):
+                # the command restarted the server
+                ConnectionCache.discard(conn)
+                conn = self.driver.connect(self)
+                self.guard(self.driver, conn)
+                self.conn = conn
+            if hook.get('sql') and hasattr(conn, 'cursor'):
+                # statements like DISCARD ALL refuse to run inside a transaction,
+                # and the autocommit mode can not change while the previous run's one is open
+                try:
+                    conn.rollback()
+                except Exception as msg:
+                    # e.g. no transactions at all, or a JDBC connection in autocommit mode
+                    logging.info(f'No rollback before the cache flush: {msg}')
+                if hasattr(conn, 'set_autocommit'):
+                    conn.set_autocommit(True)
+                elif isinstance(getattr(conn, 'autocommit', None), bool):
+                    conn.autocommit = True
+                c = conn.cursor()
+                c.execute(hook['sql'])
+                c.close()
+                if hasattr(conn, 'set_autocommit'):
+                    conn.set_autocommit(False)
+                elif isinstance(getattr(conn, 'autocommit', None), bool):
+                    conn.autocommit = False
+                if hasattr(self.driver, 'limit'):
+                    self.driver.limit(self, conn, self.timeout or 0)
+        except (Exception, subprocess.SubprocessError) as msg:
+            logging.error(f'EXCEPTION {msg}')
+            self.error = f'cache flush failed: {msg}'
+            return False
+        return True
+
+    def guard(self, driver, conn):
+        """
+        Prepare the cancellation of runs that exceed the timeout on the connection.
+        The driver may set a server side limit with limit(sqalpel, conn, seconds) and
+        provide a native cancel(sqalpel, conn). Closing the connection is the last resort.
+        """
+        self.driver = driver
+        if hasattr(driver, 'limit'):
+            try:
+                # a cached connection may still carry the limit of a previous task
+                driver.limit(self, conn, self.timeout or 0)
+            except Exception as msg:
+                logging.error(f'Server side timeout not set: {msg}')
+        self.cancel = []
+        if not self.timeout:
+            return
+        if self.watchdog is None:
+            Sqalpel.watchdog = Watchdog()
+        if hasattr(driver, 'cancel'):
+            self.cancel.append(('native', lambda: driver.cancel(self, conn)))
+        self.cancel.append(('close', conn.close))
+
+    def expired(self):
+        # Tell whether the failure of a run is caused by the timeout
+        if not self.timeout or self.ticks is None:
+            return False
+        if self.cancel and self.watchdog.fired:
+            return True
+        return time.perf_counter_ns() - self.ticks >= self.timeout * 1000000000
+
+    def recover(self, driver, conn):
+        """
+        Wrap up a run cancelled by the timeout and return a usable connection
+        for the next variant, a new one if the old one did not survive.
+        """
+        how = self.watchdog.disarm() if self.cancel else None
+        if self.resources is not None:
+            self.sampler.end()
+        self.timedout = True
+        self.ticks = None
+        self.metrics['timeout'] = {'limit': self.timeout, 'cancel': how or 'server'}
+        logging.info(f'Run cancelled after {self.timeout} seconds')
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        if how != 'close' and ConnectionCache.healthy(conn, getattr(driver, 'ping', 'SELECT 1')):
+            return conn
+        ConnectionCache.discard(conn)
+        try:
+            conn = driver.connect(self)
+        except Exception as msg:
+            logging.error(f'EXCEPTION {msg}')
+            self.error = str(msg).replace("\n", " ").replace("'", "''")
+            return conn
+        self.guard(driver, conn)
+        return conn
+
+    def measured(self):
+        """
+        Yield the run numbers of the measurements. Without an adaptive rule it is a
+        fixed 'runlength'. Otherwise the runs continue until the relative half-width of the
+        confidence interval drops below 'precision', or a run or time budget is exhausted.
+            "adaptive": {"precision": 0.05, "confidence": 0.95, "statistic": "median",
+                         "min": 3, "max": 100, "budget": 60}
+        The achieved precision and the reason to stop are reported in metrics['adaptive'].
+        """
+        if not self.adaptive:
+            for i in range(self.runlength):
+                if self.timedout:
+                    return
+                yield i
+            return
+
+        rule = self.adaptive
+        target = float(rule.get('precision', 0.05))
+        confidence = float(rule.get('confidence', 0.95))
+        statistic = rule.get('statistic', 'median')
+        minimum = int(rule.get('min', 3))
+        maximum = int(rule.get('max', 100))
+        budget = float(rule.get('budget', 0))
+        begin = time.perf_counter()
+        i = 0
+        while True:
+            achieved = Precision.relative(self.times, statistic, confidence)
+            stop = None
+            if self.error:
+                stop = 'error'
+            elif self.timedout:
+                stop = 'timeout'
+            elif len(self.times) >= minimum and achieved is not None and achieved <= target:
+                stop = 'precision'
+            elif i >= maximum:
+                stop = 'max-runs'
+            elif budget and time.perf_counter() - begin >= budget:
+                stop = 'budget'
+            self.metrics['adaptive'] = {'runs': i,
+                                        'statistic': statistic,
+                                        'precision': achieved,
+                                        'target': target,
+                                        'stop': stop}
+            if stop:
+                return
+            yield i
+            i += 1
 
     def generate(self):
         logging.info(f"{self.gen}, {self.error}, {self.debug}")
+        if self.race:
+            yield from self.racing()
+            return
+        timeouts = []
         for z in self.gen:
             if self.error:
                 break
+            if self.monotone and self.implied(z, timeouts):
+                self.prune(z)
+                continue
+            self.timedout = False
+            yield from self.variant(z)
+            if self.timedout:
+                timeouts.append(z)
+
+    def finish(self, res):
+        """
+        Attach the statistical summary of a variant. Without the 'raw' option
+        only the summary and the first checksum are kept of the individual runs.
+        """
+        self.breakdown(res)
+        if self.options.get('summary', True):
+            res['summary'] = Summary.of(res['times'], int(self.options.get('trim', 1)), res['phases'])
+            if res['summary']:
+                for label, times in res.get('series', {}).items():
+                    res['summary'][label] = Summary.of(times, 0)
+                parts = res['metrics'].get('breakdown')
+                if parts:
+                    res['summary']['breakdown'] = {k: Summary.of([v for v in parts[k] if v is not None], 0)
+                                                   for k in ('client', 'server', 'overhead')}
+        if not self.options.get('raw', True):
+            res['times'] = []
+            res['series'] = {}
+            res['phases'] = {}
+            res['chksum'] = res['chksum'][:1]
+            res['fingerprint'] = res['fingerprint'][:1]
+
+    @staticmethod
+    def breakdown(res):
+        """
+        Put the client time of each run, i.e. its execute, first and fetch phases, next to the
+        time the engine reported for the query in metrics['server']. The difference is the
+        overhead of the network, the protocol and the client library.
+        """
+        server = res['metrics'].get('server')
+        if not server or len(server) != len(res['times']):
+            return
+        client = [sum(res['phases'].get(p, [0] * len(server))[i] for p in ('execute', 'first', 'fetch')) / 1000000
+                  for i in range(len(server))]
+        elapsed = [s.get('elapsed') for s in server]
+        if all(e is None for e in elapsed):
+            return
+        res['metrics']['breakdown'] = {'client': client,
+                                       'server': elapsed,
+                                       'overhead': [None if e is None else c - e for c, e in zip(client, elapsed)]}
+
+    def rank(self, name, value):
+        # Order of a parameter value by cost; numbers compare directly, otherwise by list position
+        if isinstance(value, (int, float)):
+            r = value
+        else:
+            r = self.data[self.names.index(name)].index(value)
+        return -r if self.monotone[name] == 'desc' else r
+
+    def implied(self, z, timeouts):
+        """
+        A combination is implied to time out when a timed out combination exists that equals
+        it on the other parameters and is at most as costly on all monotone ones.
+        """
+        for t in timeouts:
+            for n, a, b in zip(self.names, t, z):
+                if n in self.monotone:
+                    if self.rank(n, b) < self.rank(n, a):
+                        break
+                elif a != b:
+                    break
+            else:
+                return True
+        return False
+
+    def prune(self, z):
+        args = {n: v for n, v in zip(self.names, z)}
+        if self.debug:
+            logging.info(f'Pruned {args}')
+        self.results.append({'times': [],
+                             'phases': {},
+                             'chksum': [],
+                             'fingerprint': [],
+                             'param': args,
+                             'error': '',
+                             'outcome': 'pruned (implied timeout)',
+                             'metrics': {}})
+
+    def variant(self, z):
+        # Run a single parameter combination and keep its result
+        if self.debug:
+            logging.info(f'Parameter: {z}')
+            logging.info(self.task['query'])
+
+        self.args = {}
+        for n, v in zip(self.names, z):
+            if self.task['params']:
+                self.args.update({n: v})
+        self.times = []
+        self.phases = {}
+        self.series = {}
+        self.plan = None
+        self.prints = []
+        self.chks = []
+
+        newquery = self.task['query']
+        newbefore = self.prelude
+        newafter = self.postlude
+        if z and self.task['params']:
+            # fill the parameter slots of the compiled templates
+            values = [str(v) for v in z]
+            newquery = self.templates[0].render(values)
+            newbefore = self.templates[1].render(values)
+            newafter = self.templates[2].render(values)
             if self.debug:
-                logging.info(f'Parameter: {z}')
-                logging.info(self.task['query'])
+                if newbefore:
+                    logging.info(f'Before {newbefore}')
+                logging.info(f'Query {newquery}')
+                if newafter:
+                    logging.info(f'After {newafter}')
+        try:
+            # Collect some system metrics
+            preload = [v for v in list(os.getloadavg())]
+        except os.error:
+            preload = 0
+        self.metrics = {'load': preload}
+        if self.connection:
+            self.metrics['connect'] = self.connection
+
+        if self.debug:
+            logging.info(f"Run {self.task}")
+
+        if self.debug:
+            logging.info(f"EXECUTE BEFORE {newbefore}")
+            logging.info(f"EXECUTE QUERY  {newquery}")
+            logging.info(f"EXECUTE AFTER  {newafter}")
 
-            self.args = {}
-            for n, v in zip(self.names, z):
-                if self.task['params']:
-                    self.args.update({n: v})
+        yield newbefore, newquery, newafter
+        if self.pipeline:
+            # an aborted run should not hold back the network traffic
+            self.pipeline.leave()
+        res = {'times': self.times,
+               'phases': self.phases,
+               'chksum': self.chks,
+               'fingerprint': self.prints,
+               'param': self.args,
+               'error': self.error,
+               'outcome': 'error' if self.error else 'timeout' if self.timedout else 'ok',
+               'metrics': self.metrics
+               }
+        if self.series:
+            res['series'] = self.series
+        if self.plan:
+            key = '/'.join(str(self.task.get(k)) for k in ('project', 'experiment', 'xname', 'dbms', 'db'))
+            res['plan'] = Plans.record(key + '/' + newquery, self.plan)
+        if self.chks or self.timedout:
+            if not self.race:
+                self.finish(res)
+            self.results.append(res)
+            self.ticks = None
             self.times = []
+            self.phases = {}
+            self.prints = []
             self.chks = []
 
-            newquery = self.task['query']
-            newbefore = self.prelude
-            newafter = self.postlude
-            if z:
-                # replace the variables in the query
-                for elm in self.args.keys():
-                    newquery = re.sub(elm, str(self.args[elm]), newquery)
-                    if newbefore:
-                        newbefore = re.sub(elm, str(self.args[elm]), newbefore)
-                    if newafter:
-                        newafter = re.sub(elm, str(self.args[elm]), newafter)
-                if self.debug:
-                    if newbefore:
-                        logging.info(f'Before {newbefore}')
-                    logging.info(f'Query {newquery}')
-                    if newafter:
-                        logging.info(f'After {newafter}')
-            try:
-                # Collect some system metrics
-                preload = [v for v in list(os.getloadavg())]
-            except os.error:
-                preload = 0
-            self.metrics = {'load': preload}
+    def racing(self):
+        """
+        Successive halving over the variants. All variants first run a few times, then
+        the clearly dominated ones are dropped and the contenders get more repetitions.
+            "race": {"objective": "fastest", "runs": 3, "eta": 2, "keep": 1,
+                     "statistic": "median", "confidence": 0.95}
+        Each round keeps the variants whose confidence interval overlaps with the best one,
+        at most a 1/eta fraction of them, and multiplies the runs per variant by eta.
+        The results carry the final rank and confidence bounds in metrics['race'].
+        """
+        rule = self.race
+        slowest = rule.get('objective', 'fastest') == 'slowest'
+        runs = int(rule.get('runs', 3))
+        eta = max(2, int(rule.get('eta', 2)))
+        keep = max(1, int(rule.get('keep', 1)))
+        statistic = rule.get('statistic', 'median')
+        confidence = float(rule.get('confidence', 0.95))
 
-            if self.debug:
-                logging.info(f"Run {self.task}")
+        runlength, adaptive = self.runlength, self.adaptive
+        cold, warmup = self.cold, self.warmup
+        self.adaptive = None
+        variants = list(self.gen)
+        merged = [None] * len(variants)
+        alive = list(range(len(variants)))
+        rounds = 0
+        while alive and not self.error:
+            self.runlength = runs
+            for i in alive:
+                if self.error:
+                    break
+                count = len(self.results)
+                self.timedout = False
+                yield from self.variant(variants[i])
+                if len(self.results) > count:
+                    res = self.results.pop()
+                    if merged[i] is None:
+                        merged[i] = res
+                    else:
+                        merged[i]['times'] += res['times']
+                        merged[i]['chksum'] += res['chksum']
+                        merged[i]['fingerprint'] += res['fingerprint']
+                        for k, v in res['phases'].items():
+                            merged[i]['phases'].setdefault(k, []).extend(v)
+                        # the measurements per run are kept for all rounds
+                        samples = {k: merged[i]['metrics'].get(k, []) + res['metrics'].get(k, [])
+                                   for k in ('resources', 'server')}
+                        merged[i]['metrics'].update(res['metrics'])
+                        merged[i]['metrics'].update({k: v for k, v in samples.items() if v})
+                    merged[i]['metrics']['race'] = {'round': rounds}
+            rounds += 1
+            # the run protocol only applies to the first encounter of a variant
+            self.cold = self.warmup = 0
+            if len(alive) <= keep:
+                break
 
+            # rank the contenders on their center, slowest first when asked for
+            bounds = {}
+            for i in alive:
+                times = merged[i]['times'] if merged[i] else []
+                ci = Precision.interval(times, statistic, confidence) if len(times) > 1 else None
+                if ci is None and times:
+                    ci = (times[0], times[0], times[0])
+                if ci:
+                    bounds[i] = ci
+            ranked = sorted(bounds, key=lambda i: bounds[i][0], reverse=slowest)
+            if not ranked:
+                break
+            best = bounds[ranked[0]]
+            if slowest:
+                contenders = [i for i in ranked if bounds[i][2] >= best[1]]
+            else:
+                contenders = [i for i in ranked if bounds[i][1] <= best[2]]
+            alive = contenders[:max(keep, -(-len(alive) // eta))]
+            runs *= eta
             if self.debug:
-                logging.info(f"EXECUTE BEFORE {newbefore}")
-                logging.info(f"EXECUTE QUERY  {newquery}")
-                logging.info(f"EXECUTE AFTER  {newafter}")
-
-            yield newbefore, newquery, newafter
-            res = {'times': self.times,
-                   'chksum': self.chks,
-                   'param': self.args,
-                   'error': self.error,
-                   'metrics': self.metrics
-                   }
-            if self.chks:
-                self.results.append(res)
-                self.ticks = None
-                self.times = []
-                self.chks = []
+                logging.info(f'Race round {rounds} keeps {len(alive)} variants')
 
-    def get_work(self):
-        logging.info(f"{self.server}")
-        self.error = None
-        self.task = None
+        # the final ranking puts the survivors of the latest rounds first
+        finished = [i for i in range(len(variants)) if merged[i]]
+        for i in finished:
+            ci = Precision.interval(merged[i]['times'], statistic, confidence)
+            center = ci[0] if ci else merged[i]['times'][0] if merged[i]['times'] else None
+            merged[i]['metrics']['race'].update({'statistic': statistic,
+                                                 'center': center,
+                                                 'low': ci[1] if ci else center,
+                                                 'high': ci[2] if ci else center})
+        # variants without samples, e.g. timed out ones, come last in their round
+        finished.sort(key=lambda i: (-merged[i]['metrics']['race']['round'],
+                                     merged[i]['metrics']['race']['center'] is None,
+                                     (merged[i]['metrics']['race']['center'] or 0) * (-1 if slowest else 1)))
+        for rank, i in enumerate(finished):
+            merged[i]['metrics']['race']['rank'] = rank + 1
+            self.finish(merged[i])
+            self.results.append(merged[i])
+        self.runlength, self.adaptive = runlength, adaptive
+        self.cold, self.warmup = cold, warmup
+
+    @staticmethod
+    def http():
+        """
+        All traffic with the webserver goes through a single pooled keep-alive session.
+        Connection failures are retried with a backoff, reads only for idempotent requests.
+        """
+        if Sqalpel.session is None:
+            retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504))
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retries)
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            Sqalpel.session = session
+        return Sqalpel.session
 
+    def lease(self):
+        """
+        Obtain the next tasks from the webserver in a single round trip.
+        With a batch size above one the server returns a list of up to 'batch' tasks.
+        It only performs network traffic, which makes it safe to call from a pipeline worker.
+        None is returned when the server could not be reached.
+        """
         endpoint = 'http://' + self.server + '/get_work'
         args = {'ticket': self.ticket}
+        if self.batch > 1:
+            args['batch'] = self.batch
         if self.debug:
             logging.info(f'Ticket used {self.ticket}')
 
@@ -196,31 +839,53 @@ class Sqalpel:
             if self.debug:
                 logging.info(f'Endpoint {endpoint}')
                 logging.info(f'Requesting {json.dumps(args, sort_keys=True, indent=4)}')
-            response = requests.get(endpoint,  json=args, timeout=20)
+            response = Sqalpel.http().get(endpoint, json=args, timeout=20)
         except requests.exceptions.RequestException as e:
-            self.error = e
             logging.error(f'REQUESTS exception {e}')
-            return
+            return None
 
         if response.status_code != 200:
-            return
+            return None
 
-        task = json.loads(response.content)
-        if not task:
+        tasks = json.loads(response.content)
+        if not tasks:
             logging.info(f'No tasks available for the target section {json.dumps(args, sort_keys=True, indent=4)}')
-        else:
-            self.prepare(task)
-            if self.debug:
-                logging.info(f'Task received: {json.dumps(self.task, sort_keys=True, indent=4)}')
+            return []
+        if isinstance(tasks, dict):
+            return [tasks]
+        return tasks
+
+    def get_work(self):
+        logging.info(f"{self.server}")
+        self.error = None
+        self.task = None
+        # the results of the previous task are sent already
+        self.results = []
+
+        if not self.leased:
+            self.leased = self.pipeline.next() if self.pipeline else self.lease()
+        if self.leased is None:
+            self.error = 'Lost connection with the sqalpel server'
+        if not self.leased:
+            self.leased = []
+            return False
+
+        task = self.leased.pop(0)
+        self.prepare(task)
+        if self.debug:
+            logging.info(f'Task received: {json.dumps(self.task, sort_keys=True, indent=4)}')
+        return self.error is None
 
     def put_work(self):
+        if self.task is None:
+            # no task was leased, there is nothing to report
+            return None
         if not self.results:
             self.error = 'Missing result object'
             if self.debug:
                 logging.info('Missing result object')
             return None
 
-        endpoint = 'http://' + self.server + '/put_work'
         # prepare the answer for the webserver
         u = {'ticket': self.task['ticket'],
              'db': self.task['db'],
@@ -231,18 +896,63 @@ class Sqalpel:
              'tag': self.task['tag'],
              }
         u.update({'runs': self.results})
+        plans = Plans.groups(self.results)
+        if plans:
+            u['plans'] = plans
+        self.outgoing.append(u)
+        # the outbox makes each result durable at once, it batches the uploads itself
+        if len(self.outgoing) < self.upload and not self.outbox:
+            return True
+        return self.flush()
+
+    def flush(self):
+        """
+        Post the pending task results. A single result is sent as before, multiple
+        results are combined into one gzip compressed 'batch' body.
+        """
+        if not self.outgoing:
+            return True
+        if self.outbox:
+            self.outbox.append(self.outgoing)
+            self.outgoing = []
+            return True
+        if self.pipeline:
+            self.pipeline.submit(self.outgoing)
+            self.outgoing = []
+            if self.pipeline.failed:
+                # the pipeline keeps trying, but the caller should know
+                self.error = f'Failed to send {self.pipeline.failed} task results'
+                return False
+            return True
+        if self.post(self.outgoing):
+            self.outgoing = []
+            return True
+        self.error = 'Failed to send the task results'
+        return False
+
+    def post(self, outgoing):
+        """
+        Deliver a list of task results to the webserver.
+        It only performs network traffic, which makes it safe to call from a pipeline worker.
+        """
+        endpoint = 'http://' + self.server + '/put_work'
+        if len(outgoing) == 1:
+            body = json.dumps(outgoing[0]).encode('utf-8')
+            headers = {'Content-Type': 'application/json'}
+        else:
+            body = gzip.compress(json.dumps({'batch': outgoing}).encode('utf-8'))
+            headers = {'Content-Type': 'application/json', 'Content-Encoding': 'gzip'}
 
         # move the message to the webserver
         response = ''
         try:
             if self.debug:
-                logging.info(f'sending {json.dumps(u, sort_keys=True, indent=4)}')
-            response = requests.post(endpoint, json=u)
+                logging.info(f'sending {json.dumps(outgoing, sort_keys=True, indent=4)}')
+            response = Sqalpel.http().post(endpoint, data=body, headers=headers, timeout=60)
             if self.debug:
                 logging.info(f'Sent task result{response}')
             return response.status_code == 200
         except requests.exceptions.RequestException as e:
-            self.error = e
             logging.error(f'REQUESTS exception {e}')
             logging.error(f'Failed to post to {endpoint}')
         logging.info(f'Sent task result{response}')
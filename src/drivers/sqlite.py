@@ -8,65 +8,36 @@ Copyright 2019- Stichting Sqalpel
 Author: M Kersten
 
 The prototypical driver to run a Sqalpel experiment and report on it.
+The SQLite database name is derived from the Scalpel database name with extension .db
+The query plan is the tree of EXPLAIN QUERY PLAN, indented by its depth.
 """
 
-import logging
 import sqlite3
 
+from src.drivers.dbapi import DBAPIDriver
 
-class Sqlite:
 
-    @staticmethod
-    def run(sqalpel):
-        """
-        The SQLite database name is derived from the Scalpel database name with extension .db
-        :param sqalpel:
-        :return:
-        """
-
-        # Establish a clean connection
-        try:
-            conn = sqlite3.connect(sqalpel.target['dbfarm'] + sqalpel.db + '.db', timeout=sqalpel.timeout)
-        except (Exception, sqlite3.DatabaseError()) as msg:
-            sqalpel.error = msg
-            logging.error(f"EXCEPTION {msg}")
-            return
-
-        # Collects all variants of an experiment
-        for before, query, after in sqalpel.generate():
-
-            # Process all experiments multiple times
-            try:
-                for i in range(sqalpel.runlength):
-                    c = conn.cursor()
-                    if before:
-                        c.execute(before)
-
-                    sqalpel.start()
-                    c.execute(query)
-                    sqalpel.done()
-                    try:
-                        # if we have a result set, then obtain first row to represent it
-                        r = c.fetchone()
-                        if r:
-                            sqalpel.keep(r)
-                        else:
-                            sqalpel.keep('')
-                    except (Exception, sqlite3.DatabaseError) as e:
-                        sqalpel.error = e
+class Sqlite(DBAPIDriver):
+    error = sqlite3.DatabaseError
 
-                    if after:
-                        c.execute(after)
-
-                    c.close()
-
-            except (Exception, sqlite3.DatabaseError) as msg:
-                logging.error(f'EXCEPTION  {msg}')
-                sqalpel.error = str(msg).replace("\n", " ").replace("'", "''")
+    @staticmethod
+    def connect(sqalpel):
+        # the busy timeout of a locked database, sqlite3 refuses None
+        return sqlite3.connect(sqalpel.target['dbfarm'] + sqalpel.db + '.db', timeout=sqalpel.timeout or 5.0)
 
-        # Establish a clean wrapup
-        try:
-            conn.close()
-        except (Exception,  sqlite3.DatabaseError) as msg:
-            sqalpel.error = msg
-            logging.error(f"EXCEPTION {msg}")
\ No newline at end of file
+    @staticmethod
+    def cancel(sqalpel, conn):
+        # interrupt() is safe to call from another thread
+        conn.interrupt()
+
+    @classmethod
+    def explain(cls, sqalpel, conn, query):
+        c = conn.cursor()
+        c.execute('EXPLAIN QUERY PLAN ' + query)
+        depth = {0: -1}
+        lines = []
+        for node, parent, _, detail in c.fetchall():
+            depth[node] = depth.get(parent, -1) + 1
+            lines.append('  ' * depth[node] + detail)
+        c.close()
+        return '\n'.join(lines)
@@ -8,18 +8,26 @@ Copyright 2019- Stichting Sqalpel.
 Author: M Kersten
 This program is intended run the experiments against MonetDB.
 It either contacts the sqapel website or uses a experiments.yaml file.
+The driver section of the configuration file named after the DBMS of a task, or the one
+given with --driver, is handed to the driver as sqalpel.target.
 
 Accessing the website requires a session key obtained using a session
 login to the website.
 """
 
 import argparse
+import json
+import os
 import time
 import logging
 
+import yaml
+
 from src.drivers.repository import Repository
+from src.drivers.outbox import Outbox
+from src.drivers.pipeline import Pipeline
+from src.drivers.registry import Registry
 from src.drivers.sqalpel import Sqalpel
-from monetdb import MonetDB
 
 parser = argparse.ArgumentParser(
     description='This program is the MonetDB experiment driver for SQALPEL.io. '
@@ -31,14 +39,23 @@ parser = argparse.ArgumentParser(
     formatter_class=argparse.HelpFormatter)
 
 
+parser.add_argument('--config', type=str, help='Configuration file to use', default='squll.yaml')
+parser.add_argument('--driver', type=str, help='Driver section of the configuration file', default=None)
 parser.add_argument('--ticket', type=str, help='Ticket', default='local')
 parser.add_argument('--repository', type=str, help='Project Git', default='https://github.com/sqalpel/wisconsin.git')
 
 parser.add_argument('--server', type=str, help='Sqalpel server URL', default='localhost:5000')
+parser.add_argument('--batch', type=int, help='Number of tasks leased per request', default=1)
+parser.add_argument('--upload', type=int, help='Number of task results sent per request', default=1)
+parser.add_argument('--outbox', type=str, help='Directory of the durable result journal', default=None)
+parser.add_argument('--sequential', help='Do not overlap server interaction with the experiments',
+                    action='store_true')
 
 parser.add_argument('--db', type=str, help='Default database', default='wisconsin')
 parser.add_argument('--dbms', type=str, help='Default DBMS', default='MonetDB')
 parser.add_argument('--host', type=str, help='Default host', default='localhost')
+parser.add_argument('--options', type=str, help='Task options of the local experiments, in JSON',
+                    default='{"runlength":1}')
 
 parser.add_argument('--bailout', type=int, help='Abort after a number of errors', default=1)
 parser.add_argument('--timeout', type=int, help='Abort lengthy experiments', default=None)
@@ -61,6 +78,23 @@ if __name__ == '__main__':
                         format='%(levelname)-7s %(asctime)s  %(message)s',
                         datefmt='%H:%M:%S')
 
+    # The driver sections describe how to reach each DBMS
+    config = {}
+    if os.path.exists(args.config):
+        with open(args.config, 'r') as f:
+            try:
+                config = yaml.safe_load(f) or {}
+            except yaml.YAMLError as msg:
+                logging.error(f'Invalid configuration file {args.config}: {msg}')
+                exit(-1)
+    Sqalpel.drivers = config.get('drivers') or {}
+    if args.driver:
+        if args.driver.lower() not in [k.lower() for k in Sqalpel.drivers]:
+            logging.error(f'Unknown driver section {args.driver}, known are {list(Sqalpel.drivers)}')
+            exit(-1)
+        Sqalpel.section = args.driver
+    Registry.configure(config)
+
     # Connect to the sqalpel.io webserver for the real work
     sqalpel = Sqalpel(args)
 
@@ -78,40 +112,58 @@ if __name__ == '__main__':
             exit(-1)
         experiments = config['experiments']
 
+        # e.g. --options '{"openloop": {"rate": 100, "duration": 10}}'
+        try:
+            if not isinstance(json.loads(args.options), dict):
+                raise ValueError('not a JSON object')
+        except ValueError as msg:
+            logging.error(f'Invalid task options {args.options}: {msg}')
+            exit(-1)
+
         results = []
         task = {'db': args.db,
                 'dbms': args.dbms,
                 'host': args.host,
                 'params': '',
-                'options': '{"runlength":1}'}
+                'options': args.options}
 
         for q in experiments:
             task.update({'query': q['source']})
             task.update({'xname': q['name']})
-            # Before and After commands are optional
-            if 'before' in q:
-                task.update({'before': q['before']})
-            else:
-                task.update({'before': ''})
-            if 'after' in q:
-                task.update({'after': q['after']})
-            else:
-                task.update({'after': ''})
+            # Before and After commands are optional, they become the prelude and postlude
+            task.update({'prelude': q.get('before') or ''})
+            task.update({'postlude': q.get('after') or ''})
             sqalpel.prepare(task)
 
             # Use the database specific driver class
-            MonetDB.run(sqalpel)
+            run = Registry.runner(args.dbms)
+            if run is None:
+                logging.error(f'Undefined task platform {args.dbms}')
+                exit(-1)
+            run(sqalpel)
         exit(0)
 
     # the main purpose, repeatedly get work from the webserver
     delay = 5
     bailout = args.bailout
 
+    # prefetch the next task and upload the results in the background
+    if not args.sequential:
+        sqalpel.pipeline = Pipeline(sqalpel.lease, sqalpel.post,
+                                    valid=lambda tasks: bool(tasks) and 'error' not in tasks[0])
+    # keep the results on disk until the server acknowledged them
+    if args.outbox:
+        sqalpel.outbox = Outbox(args.outbox, sqalpel.post, batch=max(1, args.upload), gate=sqalpel.pipeline)
+
     while True:
         # If we don't get any work we either should stop or wait for it
         if sqalpel.get_work():
-            # Use the database specific driver class
-            MonetDB.run(sqalpel)
+            # Use the database specific driver class, loaded on first use
+            run = Registry.runner(sqalpel.dbms)
+            if run is None:
+                sqalpel.error = f'Undefined task platform {sqalpel.dbms}'
+            else:
+                run(sqalpel)
             if args.debug:
                 logging.info(sqalpel.results)
 
@@ -137,5 +189,15 @@ if __name__ == '__main__':
             if not args.daemon:
                 break
 
+    # send the results still pending in the upload batch
+    if not sqalpel.flush():
+        logging.error(f'Error encountered in sending result: {sqalpel.error}')
+    if sqalpel.outbox:
+        sqalpel.outbox.close()
+    if sqalpel.pipeline:
+        if not sqalpel.pipeline.close():
+            logging.error('Error encountered in sending result')
+        logging.info(f'Pipeline {sqalpel.pipeline.report()}')
+
     if args.debug:
         print('Finished all the work')
@@ -0,0 +1,50 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+A compact statistical summary of the response times of a variant.
+It is computed once on the client with NumPy and shipped along with the results,
+which saves every consumer from recomputing it and makes the raw samples optional.
+"""
+
+import numpy as np
+
+
+class Summary:
+
+    @staticmethod
+    def of(times, trim=1, phases=None):
+        """
+        :param times: the response times in ms
+        :param trim: the number of leading (warm-up) runs left out of the trimmed mean
+        :param phases: optional phase timings in ns, summarized by their median
+        :return: dictionary with the summary statistics, None without samples
+        """
+        a = np.asarray(times, dtype=float)
+        if not a.size:
+            return None
+        q1, median, q3, p90, p95, p99 = np.percentile(a, [25, 50, 75, 90, 95, 99])
+        iqr = q3 - q1
+        outliers = (a < q1 - 1.5 * iqr) | (a > q3 + 1.5 * iqr)
+        trimmed = a[trim:] if a.size > trim else a
+        summary = {'n': int(a.size),
+                   'min': float(a.min()),
+                   'max': float(a.max()),
+                   'median': float(median),
+                   'mean': float(a.mean()),
+                   'std': float(a.std(ddof=1)) if a.size > 1 else 0.0,
+                   'mad': float(np.median(np.abs(a - median))),
+                   'p90': float(p90),
+                   'p95': float(p95),
+                   'p99': float(p99),
+                   'trimmed': float(trimmed.mean()),
+                   'iqr': float(iqr),
+                   'outliers': np.flatnonzero(outliers).tolist()}
+        if phases:
+            summary['phases'] = {k: float(np.median(v)) for k, v in phases.items() if v}
+        return summary
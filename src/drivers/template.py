@@ -0,0 +1,50 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+Query templates with explicit placeholders for the experiment parameters.
+A query text is scanned once into a list of literal segments and parameter
+slots. Each variant is then produced by filling the slots and a single join.
+Parameter names are matched literally and the longest name wins, so a name
+that is a prefix of another one is no longer mangled.
+"""
+
+import re
+
+
+class Template:
+
+    def __init__(self, text, names):
+        self.text = text
+        self.parts = []
+        self.slots = []
+        if not text or not names:
+            return
+        # longest names first, the alternation then prefers them over their prefixes
+        order = sorted(set(names), key=len, reverse=True)
+        pattern = re.compile('|'.join([re.escape(n) for n in order]))
+        index = {n: i for i, n in enumerate(names)}
+        pos = 0
+        for m in pattern.finditer(text):
+            self.parts.append(text[pos:m.start()])
+            self.slots.append((len(self.parts), index[m.group()]))
+            self.parts.append(None)
+            pos = m.end()
+        self.parts.append(text[pos:])
+
+    def render(self, values):
+        """
+        :param values: the textual parameter values, in the order of the names
+        :return: the query text of the variant
+        """
+        if not self.slots:
+            return self.text
+        parts = self.parts[:]
+        for i, v in self.slots:
+            parts[i] = values[v]
+        return ''.join(parts)
@@ -0,0 +1,157 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+Run the variants of an experiment from K concurrent client sessions.
+Each client is a thread with its own database connection, obtained through
+the connect() method of the DB-API driver class. The client libraries release
+the interpreter lock while waiting for the server, which keeps the clients
+truly concurrent from the server's point of view.
+
+The task option 'concurrency' controls the experiment:
+    "concurrency": 8            scaling curve over K = 1, 2, 4, 8
+    "concurrency": "cores"      scaling curve up to the number of cores
+    "concurrency": [1, 3, 6]    an explicit list of client counts
+
+Every client runs the variant 'runlength' times. For each K we report the
+aggregate queries per second and a latency distribution per client in the
+'concurrency' section of the metrics. The 'times' list holds the latencies
+observed at the highest concurrency level.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+
+
+class Throughput:
+
+    @staticmethod
+    def levels(concurrency):
+        # Derive the client counts of the scaling curve
+        if isinstance(concurrency, list):
+            return sorted(set(int(k) for k in concurrency if int(k) > 0))
+        if concurrency == 'cores':
+            concurrency = os.cpu_count() or 1
+        concurrency = int(concurrency)
+        k = 1
+        levels = []
+        while k < concurrency:
+            levels.append(k)
+            k *= 2
+        levels.append(concurrency)
+        return levels
+
+    @staticmethod
+    def percentile(values, p):
+        # nearest-rank percentile over a sorted list
+        if not values:
+            return None
+        k = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+        return values[k]
+
+    @staticmethod
+    def distribution(times):
+        t = sorted(times)
+        if not t:
+            return {'count': 0}
+        return {'count': len(t),
+                'min': t[0],
+                'mean': sum(t) / len(t),
+                'median': Throughput.percentile(t, 50),
+                'p95': Throughput.percentile(t, 95),
+                'p99': Throughput.percentile(t, 99),
+                'max': t[-1]}
+
+    @staticmethod
+    def execute(conn, before, query, after):
+        """
+        Execute one variant on a private connection and return its latency in ms.
+        The prelude and postlude are kept outside the measured interval.
+        """
+        c = conn.cursor()
+        if before:
+            c.execute(before)
+        ticks = time.perf_counter_ns()
+        c.execute(query)
+        if c.description:
+            c.fetchall()
+        ticks = time.perf_counter_ns() - ticks
+        if after:
+            c.execute(after)
+        c.close()
+        return ticks / 1000000
+
+    @staticmethod
+    def client(driver, sqalpel, variant, runs, barrier, out):
+        times = []
+        out['times'] = times
+        conn = None
+        try:
+            conn = driver.connect(sqalpel)
+        except Exception as msg:
+            out['error'] = str(msg)
+        # all clients start together, also when their connect failed
+        barrier.wait()
+        if conn is None:
+            return
+        try:
+            for i in range(runs):
+                times.append(Throughput.execute(conn, *variant))
+        except Exception as msg:
+            out['error'] = str(msg).replace("\n", " ").replace("'", "''")
+        try:
+            conn.close()
+        except Exception as msg:
+            logging.error(f"EXCEPTION {msg}")
+
+    @staticmethod
+    def run(driver, sqalpel):
+        levels = Throughput.levels(sqalpel.concurrency)
+        logging.info(f"Concurrency levels {levels}")
+
+        # Collects all variants of an experiment
+        for variant in sqalpel.generate():
+            curve = []
+            times = []
+            for k in levels:
+                barrier = threading.Barrier(k + 1)
+                outs = [{} for _ in range(k)]
+                clients = [threading.Thread(target=Throughput.client,
+                                            args=(driver, sqalpel, variant, sqalpel.runlength, barrier, outs[i]),
+                                            daemon=True)
+                           for i in range(k)]
+                for t in clients:
+                    t.start()
+                barrier.wait()
+                ticks = time.perf_counter_ns()
+                for t in clients:
+                    t.join()
+                wall = (time.perf_counter_ns() - ticks) / 1000000000
+
+                queries = sum([len(o['times']) for o in outs])
+                curve.append({'clients': k,
+                              'queries': queries,
+                              'wall': wall,
+                              'qps': queries / wall if wall else 0,
+                              'latency': [Throughput.distribution(o['times']) for o in outs]})
+                if sqalpel.debug:
+                    logging.info(f"Concurrency {k} qps {curve[-1]['qps']}")
+
+                errors = [o['error'] for o in outs if 'error' in o]
+                if errors:
+                    logging.error(f'EXCEPTION  {errors[0]}')
+                    sqalpel.error = errors[0]
+                    break
+                times = [t for o in outs for t in o['times']]
+
+            sqalpel.times.extend(times)
+            sqalpel.chks.extend(['' for _ in times])
+            sqalpel.metrics['concurrency'] = curve
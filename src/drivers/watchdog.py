@@ -0,0 +1,67 @@
+"""
+This Source Code Form is subject to the terms of the Mozilla Public
+License, v. 2.0.  If a copy of the MPL was not distributed with this
+file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+Copyright 2019- Stichting Sqalpel
+
+Author: M Kersten
+
+A watchdog that cancels a run once it exceeds the timeout.
+A single background thread waits for the deadline of the current run, which keeps
+the cost of arming it out of the timed window. When the deadline passes the actions
+are fired one by one, separated by a grace period, e.g. first the native cancellation
+of the driver and, if the statement still does not return, closing the connection.
+"""
+
+import logging
+import threading
+import time
+
+
+class Watchdog:
+
+    def __init__(self, grace=5):
+        self.grace = grace
+        self.cond = threading.Condition()
+        self.deadline = None
+        self.actions = []
+        self.fired = None       # the name of the last action taken for the run
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def arm(self, seconds, actions):
+        """
+        :param seconds: the time the run may take
+        :param actions: list of (name, callable) pairs to stop the run
+        """
+        with self.cond:
+            self.deadline = time.monotonic() + seconds
+            self.actions = list(actions)
+            self.fired = None
+            self.cond.notify()
+
+    def disarm(self):
+        # Returns the name of the action that cancelled the run, None if it finished in time
+        with self.cond:
+            self.deadline = None
+            self.actions = []
+            return self.fired
+
+    def loop(self):
+        while True:
+            with self.cond:
+                while self.deadline is None:
+                    self.cond.wait()
+                remaining = self.deadline - time.monotonic()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                    continue
+                name, action = self.actions.pop(0)
+                self.fired = name
+                self.deadline = time.monotonic() + self.grace if self.actions else None
+            logging.info(f'Watchdog cancels the run: {name}')
+            try:
+                action()
+            except Exception as msg:
+                logging.error(f'EXCEPTION {msg}')
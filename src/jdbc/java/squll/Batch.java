@@ -0,0 +1,45 @@
+/*
+ * This Source Code Form is subject to the terms of the Mozilla Public
+ * License, v. 2.0.  If a copy of the MPL was not distributed with this
+ * file, You can obtain one at http://mozilla.org/MPL/2.0/.
+ *
+ * Copyright 2019- Stichting Sqalpel
+ *
+ * Author: M Kersten
+ *
+ * The JVM side of the JDBC fetch of squll. A batch of rows is read from the result set
+ * within the JVM and handed to Python in a single call, instead of a call per row and column.
+ * It is compiled by jdbc_driver.py into ~/.cache/squll/jdbc when a javac is available.
+ */
+package squll;
+
+import java.sql.ResultSet;
+import java.sql.SQLException;
+import java.util.ArrayList;
+
+public final class Batch {
+
+    private Batch() {
+    }
+
+    /* Read at most count rows, fewer rows means the result set is exhausted */
+    public static String[][] fetch(ResultSet rs, int count) throws SQLException {
+        int columns = rs.getMetaData().getColumnCount();
+        ArrayList<String[]> rows = new ArrayList<>(count);
+        while (rows.size() < count && rs.next()) {
+            String[] row = new String[columns];
+            for (int i = 0; i < columns; i++)
+                row[i] = rs.getString(i + 1);
+            rows.add(row);
+        }
+        return rows.toArray(new String[0][]);
+    }
+
+    /* Step through the remainder of the result set without converting it */
+    public static long skip(ResultSet rs) throws SQLException {
+        long count = 0;
+        while (rs.next())
+            count++;
+        return count;
+    }
+}
@@ -7,84 +7,221 @@ Copyright 2019- Stichting Sqalpel
 
 Author: M Kersten
 
-Execute a single query multiple times on the database nicknamed 'dbms'
-and return a list of timings. The first error encountered stops the sequence.
-The result is a dictionary with at least the structure {'times': [...]}
-
-This driver merely assumes a simple jdbc driver connection.
-Experimental, should be filled in.
-
+Run the experiments through JDBC, using one of the implementations of jdbc_implementations.py.
+The JVM is started once per squll process with the jars of the driver section on its
+class path, and the JDBC connections are kept in the connection cache across tasks.
+
+The queries are run on a plain java.sql.Statement. Its fetch size is set to 'arraysize',
+which asks the JDBC driver to transfer the result from the server in batches of that many
+rows. The rows are moved from the JVM to Python by the helper class squll.Batch
+(java/squll/Batch.java), which reads up to 'arraysize' rows per call into a String[][].
+Without a fingerprint the remainder of the result is stepped through within the JVM.
+The helper is compiled into ~/.cache/squll/jdbc when a javac is found and put on the
+class path of the JVM. Without it the rows are read one by one from Python, each
+ResultSet.next() and column access is then a call into the JVM.
+The statement gets the timeout as its query timeout and is cancelled by the watchdog.
 """
 
-import time
-import jaydebeapi
+import logging
 import os
+import shutil
+import subprocess
 
-from .jdbc_implementations import AbstractJDBCImplementation
+import jaydebeapi
+import jpype
 
+from src.drivers.dbapi import DBAPIDriver
+from .jdbc_implementations import AbstractJDBCImplementation
 
-class JDBCDriver:
 
-    def __init__(self):
-        pass
+class Cursor:
+
+    def __init__(self, jconn, arraysize, timeout=0, batch=None):
+        self.stmt = jconn.createStatement()
+        self.stmt.setFetchSize(arraysize)
+        if timeout:
+            self.stmt.setQueryTimeout(int(timeout))
+        self.arraysize = arraysize
+        self.batch = batch      # the squll.Batch helper class, if available
+        self.rs = None
+        self.exhausted = True
+        self.rows = []          # the rows moved from the JVM but not yet handed out
+        self.columns = 0
+        self.description = None
+
+    def execute(self, query):
+        if self.rs is not None:
+            self.rs.close()
+            self.rs = None
+        self.rows = []
+        self.exhausted = True
+        self.description = None
+        if self.stmt.execute(query):
+            self.rs = self.stmt.getResultSet()
+            self.exhausted = False
+            meta = self.rs.getMetaData()
+            self.columns = meta.getColumnCount()
+            self.description = [(str(meta.getColumnLabel(i)), str(meta.getColumnTypeName(i)),
+                                 None, None, None, None, None) for i in range(1, self.columns + 1)]
+
+    def fill(self, count):
+        # Move up to count rows from the result set into the buffer
+        if self.exhausted or count <= 0:
+            return
+        if self.batch is not None:
+            rows = [tuple(str(v) for v in row) for row in self.batch.fetch(self.rs, count)]
+        else:
+            rows = []
+            while len(rows) < count and self.rs.next():
+                rows.append(tuple(str(self.rs.getString(i)) for i in range(1, self.columns + 1)))
+        self.exhausted = len(rows) < count
+        self.rows.extend(rows)
+
+    def fetchone(self):
+        if not self.rows:
+            self.fill(1)
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        self.fill(size - len(self.rows))
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        while not self.exhausted:
+            self.fill(self.arraysize)
+        rows, self.rows = self.rows, []
+        return rows
+
+    def discard(self):
+        # Step through the remainder of the result set without converting the rows
+        count = len(self.rows)
+        self.rows = []
+        if not self.exhausted:
+            if self.batch is not None:
+                count += self.batch.skip(self.rs)
+            else:
+                while self.rs.next():
+                    count += 1
+            self.exhausted = True
+        return count
+
+    def cancel(self):
+        self.stmt.cancel()
+
+    def close(self):
+        if self.rs is not None:
+            self.rs.close()
+            self.rs = None
+        self.stmt.close()
+
+
+class JDBCDriver(DBAPIDriver):
+    error = jaydebeapi.DatabaseError
+    implementation = None   # the JDBC implementation of the current task
+    querytimeout = 0
+    classes = os.path.join(os.path.expanduser('~'), '.cache', 'squll', 'jdbc')
+    batch = None            # the squll.Batch helper class once the JVM runs
 
     @staticmethod
-    def run(target, implementation: AbstractJDBCImplementation):
+    def compile():
         """
-        The number of repetitions is used to derive the best-of value.
-        :param target:
-        :param implementation: A JDBC implementation Python class
-        :return:
+        Compile the squll.Batch helper into the cache directory, unless it is up to date.
+        :return: True when the compiled helper is available
         """
-        db = target['db']
-        query = target['query']
-        jdbc_uri = implementation.get_jdbc_uri().format(database=db)
-        runlength = int(target['runlength'])
-        debug = target.getboolean('trace')
-        response = {'error': '', 'times': [], 'cnt': [], 'clock': []}
-
-        conn = None
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'java', 'squll', 'Batch.java')
+        target = os.path.join(JDBCDriver.classes, 'squll', 'Batch.class')
+        if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(source):
+            return True
+        javac = shutil.which('javac')
+        if javac is None:
+            logging.info('No javac found, the JDBC rows are fetched one by one')
+            return False
         try:
-            conn = jaydebeapi.connect(implementation.get_java_driver_class(),  # JDBC library class
-                                      jdbc_uri,                                # JDBC uri
-                                      implementation.get_jdbc_properties(),    # properties for the driver
-                                      implementation.get_jdbc_jars_path())     # location of the jar
-        except (Exception, jaydebeapi.DatabaseError) as msg:
-            print('EXCEPTION :', msg)
-            if conn is not None:
-                conn.close()
-                print('Database connection closed.')
-            return response
-
-        if debug:
-            nu = time.strftime('%Y-%m-%d %H:%m:%S', time.localtime())
-            print('Run query:', nu, ':', query)
-
-        for i in range(runlength):
+            os.makedirs(JDBCDriver.classes, exist_ok=True)
+            subprocess.run([javac, '-d', JDBCDriver.classes, source], check=True,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=60)
+            return True
+        except (OSError, subprocess.SubprocessError) as msg:
+            logging.error(f'Compilation of {source} failed: {msg}')
+            return False
+
+    @staticmethod
+    def jvm(jars):
+        # The JVM can only be started once per process, its class path is fixed from then on
+        if not jpype.isJVMStarted():
+            for jar in jars:
+                jpype.addClassPath(jar)
+            if JDBCDriver.compile():
+                jpype.addClassPath(JDBCDriver.classes)
+            jpype.startJVM(jpype.getDefaultJVMPath(), convertStrings=True)
             try:
-                nu = time.strftime('%Y-%m-%d %H:%m:%S', time.localtime())
-                c = conn.cursor()
-                ticks = time.time()
-                c.execute(query)
-                response['answer'] = 'No answer'
+                JDBCDriver.batch = jpype.JClass('squll.Batch')
+            except Exception as msg:
+                logging.info(f'No squll.Batch helper, the JDBC rows are fetched one by one: {msg}')
+        else:
+            missing = [j for j in jars if j not in jpype.getClassPath()]
+            if missing:
+                logging.error(f'JVM already running without {missing} on its class path')
 
-                ticks = int((time.time() - ticks) * 1000)
-                print('ticks', ticks)
-                c.close()
+    @staticmethod
+    def connect(sqalpel):
+        implementation = JDBCDriver.implementation
+        JDBCDriver.jvm(implementation.get_jdbc_jars_path())
+        return jaydebeapi.connect(implementation.get_java_driver_class(),
+                                  implementation.get_jdbc_uri().format(database=sqalpel.db),
+                                  implementation.get_jdbc_properties(),
+                                  implementation.get_jdbc_jars_path())
 
-            except Exception as msg:
-                print('EXCEPTION :', i, msg)
-                response['error'] = str(msg).replace("\n", " ").replace("'", "''")
-                conn.close()
-                return response
+    @staticmethod
+    def ping(conn):
+        return conn.jconn.isValid(5)
 
-            response['times'].append(ticks)
-            response['clock'].append(nu)
+    @staticmethod
+    def reset(conn):
+        # JDBC refuses a rollback in autocommit mode, which is the default
+        try:
+            if not conn.jconn.getAutoCommit():
+                conn.rollback()
+            return True
+        except Exception as msg:
+            logging.info(f'Drop cached connection: {msg}')
+            return False
+
+    @staticmethod
+    def limit(sqalpel, conn, seconds):
+        JDBCDriver.querytimeout = seconds
+
+    @staticmethod
+    def cancel(sqalpel, conn):
+        if JDBCDriver.current:
+            JDBCDriver.current.cancel()
+
+    @classmethod
+    def cursor(cls, sqalpel, conn):
+        return Cursor(conn.jconn, sqalpel.arraysize, cls.querytimeout, JDBCDriver.batch)
+
+    @classmethod
+    def run(cls, sqalpel, implementation: AbstractJDBCImplementation):
+        """
+        :param sqalpel:
+        :param implementation: A JDBC implementation Python class
+        :return:
+        """
+        cls.implementation = implementation
+        super().run(sqalpel)
+
+    @classmethod
+    def launch(cls, sqalpel, implementation):
+        """
+        Configure the JDBC implementation class with the driver section of the task and run it.
+        An incomplete section fails the task instead of the worker.
+        """
         try:
-            postload = ["%.3f" % v for v in list(os.getloadavg())]
-        except os.error:
-            postload = 0
-            pass
-        response['cpuload'] = str(preload + postload).replace("'", "")
-        conn.close()
-        return response
+            configured = implementation(sqalpel.target)
+        except ValueError as msg:
+            sqalpel.error = str(msg)
+            logging.error(f'EXCEPTION {msg}')
+            return
+        cls.run(sqalpel, configured)
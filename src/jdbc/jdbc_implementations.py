@@ -5,12 +5,11 @@ from typing import Dict
 class AbstractJDBCImplementation:
 
     def __init__(self, conf_properties: Dict[str, str]):
-        config_keys = ['uri', 'jars', 'user']
+        config_keys = ['uri', 'jars']
         for c in config_keys:
             if c not in conf_properties:
-                print('Configuration key "%s" not set in configuration file for target "%s"' % (
+                raise ValueError('Configuration key "%s" not set in configuration file for target "%s"' % (
                         c, self.get_database_system_name()))
-                exit(-1)
         self.uri = conf_properties['uri']
         self.jars = [x.strip() for x in conf_properties['jars'].split(',')]
         self.properties = {}
@@ -21,18 +21,7 @@ import logging
 
 from src.drivers.repository import Repository
 from connection import Connection
-from .drivers.monetdb import MonetDB
-# from .drivers.monetdb_client_driver import MonetDBClientDriver
-# from probe.monetdblite_driver import MonetDBliteDriver
-from .drivers.clickhouse_driver import ClickhouseDriver
-from .drivers.postgresql import Postgresql
-from .drivers.sqlite import Sqlite
-from .drivers.actian_client_driver import ActianClientDriver
-from .drivers.mariadb import MariaDB
-from .drivers.firebird_driver import FirebirdDriver
-from jdbc.jdbc_driver import JDBCDriver
-from jdbc.jdbc_implementations import ApacheDerbyJDBCDriver, ApacheHiveJDBCDriver, H2JDBCDriver, HSQLDBJDBCDriver, \
-    MonetDBLiteJDBCDriver
+from src.drivers.registry import Registry
 
 parser = argparse.ArgumentParser(
     description='Squll.py is the default experiment driver for SQALPEL.io. '
@@ -70,36 +59,12 @@ parser.add_argument('--version', help='Show version info', action='store_true')
 
 def runtask(task):
     logging.info(f'run task {task}')
-    if task['dbms'].lower() == 'monetdb':
-        results = MonetDB.run(task)
-    elif task['dbms'].lower() == 'postgresql':
-        results = Postgresql.run(task)
-    elif task['dbms'].lower() == 'clickhouse':
-        results = ClickhouseDriver.run(task)
-    elif task['dbms'].lower() == 'sqlite':
-        results = Sqlite.run(task)
-    elif task['dbms'].lower() == 'actian':
-        results = ActianClientDriver.run(task)
-    elif task['dbms'].lower() == 'mariadb':
-        results = MariaDB.run(task)
-    elif task['dbms'].lower() == 'firebird':
-        results = FirebirdDriver.run(task)
-    elif task['dbms'].lower() in ('apache derby', 'derby'):
-        results = JDBCDriver.run(task, ApacheDerbyJDBCDriver(task))
-    elif task['dbms'].lower() in ('apache hive', 'hive'):
-        results = JDBCDriver.run(task, ApacheHiveJDBCDriver(task))
-    elif task['dbms'].lower() == 'h2':
-        results = JDBCDriver.run(task, H2JDBCDriver(task))
-    elif task['dbms'].lower() == 'hsqldb':
-        results = JDBCDriver.run(task, HSQLDBJDBCDriver(task))
-    elif task['dbms'].lower() == 'monetdblite-java':
-        results = JDBCDriver.run(task, MonetDBLiteJDBCDriver(task))
-    # elif args.dbms == 'MonetDBLite-Python'.lower():
-    #   results = MonetDBliteDriver.run(task, t['query'],)
-    else:
-        results = None
+    # the driver and its client library are only loaded when first needed
+    run = Registry.runner(task['dbms'])
+    if run is None:
         print('Undefined task platform', task['dbms'])
-    return results
+        return None
+    return run(task)
 
 
 if __name__ == '__main__':
@@ -136,6 +101,7 @@ if __name__ == '__main__':
             exit(-1)
 
     section = config['drivers'][args.driver]
+    Registry.configure(config)
 
     # the command line overrules the default
     if args.debug: